@@ -140,6 +140,11 @@ logger.setLevel(logging.INFO)
     help='Number of secondary workers for Dataproc clusters, as well as the'
     'number of shards to parition data for the AS-VQSR analysis',
 )
+@click.option(
+    '--dataproc-autoscaling-policy',
+    'dataproc_autoscaling_policy',
+    help='Name of a Dataproc autoscaling policy to use for the variant QC clusters',
+)
 @click.option(
     '--num-ancestry-pcs',
     'num_ancestry_pcs',
@@ -197,6 +202,7 @@ def main(  # pylint: disable=too-many-arguments,too-many-locals,too-many-stateme
     overwrite: bool,
     skip_samples: Collection[str],
     scatter_count: int,
+    dataproc_autoscaling_policy: Optional[str],
     pca_pop: Optional[str],
     num_ancestry_pcs: int,
     dry_run: bool,
@@ -386,6 +392,7 @@ def main(  # pylint: disable=too-many-arguments,too-many-locals,too-many-stateme
         is_test=output_namespace in ['test', 'tmp'],
         depends_on=[combiner_job, sample_qc_job],
         project_name=analysis_project,
+        autoscaling_policy=dataproc_autoscaling_policy,
     )
 
     # Interacting with the sample metadata server.
@@ -20,14 +20,23 @@ def get_cluster(
     phantomjs: bool = False,
     preemptible: bool = True,
     depends_on: Optional[List[Job]] = None,
+    autoscaling_policy: Optional[str] = None,
 ) -> dataproc.DataprocCluster:
     """
-    Get or create a Dataproc cluster by name
+    Get or create a Dataproc cluster by name.
+
+    If `autoscaling_policy` is provided, the cluster will use this Dataproc
+    autoscaling policy to add and remove secondary workers, with `num_workers`
+    as the initial number.
     """
     max_age = '1h' if is_test else '8h'
     if long:
         max_age = '3h' if is_test else '24h'
 
+    kwargs = {}
+    if autoscaling_policy:
+        kwargs['autoscaling_policy'] = autoscaling_policy
+
     return dataproc.setup_dataproc(
         b,
         max_age=max_age,
@@ -39,4 +48,5 @@ def get_cluster(
         init=['gs://cpg-reference/hail_dataproc/install_phantomjs.sh']
         if phantomjs
         else [],
+        **kwargs,
     )
@@ -36,137 +36,154 @@ def add_variant_qc_jobs(
     project_name: str,
     depends_on: Optional[List[Job]] = None,
     run_rf: bool = False,
+    autoscaling_policy: Optional[str] = None,
 ) -> List[Job]:
     """
-    Add variant QC Hail-query jobs
+    Add variant QC Hail-query jobs.
+
+    Jobs are submitted to one long Dataproc cluster, except the jobs following
+    AS-VQSR, which get a separate cluster started only once AS-VQSR is finished.
+    If `autoscaling_policy` is provided, the clusters will scale with the number
+    of concurrent jobs.
     """
     rf_bucket = join(work_bucket, 'rf')
     vqsr_bucket = join(work_bucket, 'vqsr')
 
-    # Starting 3 clusters to work in parallel. The last one is long, to submit
-    # further jobs
-    cluster1 = get_cluster(
-        b, f'VarQC 1', scatter_count, is_test=is_test, depends_on=depends_on
-    )
-    cluster2 = get_cluster(
-        b, f'VarQC 2', scatter_count, is_test=is_test, depends_on=depends_on
-    )
-    cluster3 = get_cluster(
-        b, f'VarQC 3', scatter_count, is_test=is_test, depends_on=depends_on, long=True
+    # Starting one cluster for all jobs up to the filtering model, instead of
+    # a separate cluster for each stage. Info, annotations and frequencies jobs
+    # are submitted to it concurrently, and the following jobs reuse it
+    cluster = get_cluster(
+        b,
+        'VarQC',
+        scatter_count * 3,
+        is_test=is_test,
+        depends_on=depends_on,
+        long=True,
+        autoscaling_policy=autoscaling_policy,
     )
 
     fam_stats_ht_path = join(work_bucket, 'fam-stats.ht') if ped_file else None
     allele_data_ht_path = join(work_bucket, 'allele-data.ht')
     qc_ac_ht_path = join(work_bucket, 'qc-ac.ht')
-    rf_result_ht_path = None
-
-    job_name = 'Var QC: generate info'
     info_ht_path = join(work_bucket, 'info.ht')
     info_split_ht_path = join(work_bucket, 'info-split.ht')
-    if any(
-        not utils.can_reuse(fp, overwrite) for fp in [info_ht_path, info_split_ht_path]
-    ):
-        info_job = cluster1.add_job(
-            f'{utils.SCRIPTS_DIR}/generate_info_ht.py --overwrite '
-            f'--mt {raw_combined_mt_path} '
-            f'--out-info-ht {info_ht_path} '
-            f'--out-split-info-ht {info_split_ht_path}',
-            job_name=job_name,
-        )
-    else:
-        info_job = b.new_job(f'{job_name} [reuse]')
-    if depends_on:
-        info_job.depends_on(*depends_on)
-
-    job_name = 'Var QC: generate annotations'
-    if any(
-        not utils.can_reuse(fp, overwrite)
-        for fp in [allele_data_ht_path, qc_ac_ht_path]
-        + ([fam_stats_ht_path] if fam_stats_ht_path else [])
-    ):
-        var_qc_anno_job = cluster2.add_job(
-            f'{utils.SCRIPTS_DIR}/generate_variant_qc_annotations.py '
-            + f'{"--overwrite " if overwrite else ""}'
-            + f'--mt {raw_combined_mt_path} '
-            + f'--hard-filtered-samples-ht {hard_filter_ht_path} '
-            + f'--meta-ht {meta_ht_path} '
-            + f'--out-allele-data-ht {allele_data_ht_path} '
-            + f'--out-qc-ac-ht {qc_ac_ht_path} '
-            + (f'--out-fam-stats-ht {fam_stats_ht_path} ' if ped_file else '')
-            + (f'--fam-file {ped_file} ' if ped_file else '')
-            + f'--bucket {work_bucket} '
-            + f'--n-partitions {scatter_count * 25}',
-            job_name=job_name,
-        )
-        if depends_on:
-            var_qc_anno_job.depends_on(*depends_on)
-    else:
-        var_qc_anno_job = b.new_job(f'{job_name} [reuse]')
-
-    job_name = 'Var QC: generate frequencies'
     freq_ht_path = join(work_bucket, 'frequencies.ht')
-    if overwrite or not utils.file_exists(freq_ht_path):
-        freq_job = cluster3.add_job(
-            f'{utils.SCRIPTS_DIR}/generate_freq_data.py --overwrite '
-            f'--mt {raw_combined_mt_path} '
-            f'--hard-filtered-samples-ht {hard_filter_ht_path} '
-            f'--meta-ht {meta_ht_path} '
-            f'--out-ht {freq_ht_path} '
-            f'--bucket {work_bucket} ',
-            job_name=job_name,
-        )
-        if depends_on:
-            freq_job.depends_on(*depends_on)
-    else:
-        freq_job = b.new_job(f'{job_name} [reuse]')
-
-    job_name = 'Var QC: create RF annotations'
     rf_annotations_ht_path = join(work_bucket, 'rf-annotations.ht')
-    if overwrite or not utils.file_exists(rf_annotations_ht_path):
-        rf_anno_job = cluster3.add_job(
-            f'{utils.SCRIPTS_DIR}/create_rf_annotations.py --overwrite '
-            f'--info-split-ht {info_split_ht_path} '
-            f'--freq-ht {freq_ht_path} '
-            + (f'--fam-stats-ht {fam_stats_ht_path} ' if fam_stats_ht_path else '')
-            + f'--allele-data-ht {allele_data_ht_path} '
-            f'--qc-ac-ht {qc_ac_ht_path} '
-            f'--bucket {work_bucket} '
-            f'--use-adj-genotypes '
-            f'--out-ht {rf_annotations_ht_path} '
-            + f'--n-partitions {scatter_count * 25}',
-            job_name=job_name,
-        )
-        rf_anno_job.depends_on(freq_job, var_qc_anno_job, info_job)
-    else:
-        rf_anno_job = b.new_job(f'{job_name} [reuse]')
+    vqsred_vcf_path = join(vqsr_bucket, 'output.vcf.gz')
+    export_ht_path = join(work_bucket, 'export_vcf.ht')
+    export_vcf_header_txt = join(work_bucket, 'export_vcf_header.txt')
+    chroms = list(map(str, range(1, 22 + 1))) + ['X', 'Y']
+    rf_result_ht_path = join(work_bucket, 'rf-result.ht') if run_rf else None
+
+    # Checking all outputs in one go instead of a round trip per each path
+    existence = utils.prefetch_existence(
+        [
+            info_ht_path,
+            info_split_ht_path,
+            allele_data_ht_path,
+            qc_ac_ht_path,
+            fam_stats_ht_path,
+            freq_ht_path,
+            rf_annotations_ht_path,
+            rf_result_ht_path,
+            vqsred_vcf_path,
+            out_filtered_combined_mt_path,
+            export_ht_path,
+            export_vcf_header_txt,
+        ]
+        + [out_filtered_vcf_ptrn_path.format(CHROM=chrom) for chrom in chroms]
+    )
+
+    info_job = _add_job(
+        b,
+        cluster,
+        f'{utils.SCRIPTS_DIR}/generate_info_ht.py --overwrite '
+        f'--mt {raw_combined_mt_path} '
+        f'--out-info-ht {info_ht_path} '
+        f'--out-split-info-ht {info_split_ht_path}',
+        job_name='Var QC: generate info',
+        output_paths=[info_ht_path, info_split_ht_path],
+        overwrite=overwrite,
+        existence=existence,
+        depends_on=depends_on,
+    )
+
+    var_qc_anno_job = _add_job(
+        b,
+        cluster,
+        f'{utils.SCRIPTS_DIR}/generate_variant_qc_annotations.py '
+        + f'{"--overwrite " if overwrite else ""}'
+        + f'--mt {raw_combined_mt_path} '
+        + f'--hard-filtered-samples-ht {hard_filter_ht_path} '
+        + f'--meta-ht {meta_ht_path} '
+        + f'--out-allele-data-ht {allele_data_ht_path} '
+        + f'--out-qc-ac-ht {qc_ac_ht_path} '
+        + (f'--out-fam-stats-ht {fam_stats_ht_path} ' if ped_file else '')
+        + (f'--fam-file {ped_file} ' if ped_file else '')
+        + f'--bucket {work_bucket} '
+        + f'--n-partitions {scatter_count * 25}',
+        job_name='Var QC: generate annotations',
+        output_paths=[allele_data_ht_path, qc_ac_ht_path]
+        + ([fam_stats_ht_path] if fam_stats_ht_path else []),
+        overwrite=overwrite,
+        existence=existence,
+        depends_on=depends_on,
+    )
+
+    freq_job = _add_job(
+        b,
+        cluster,
+        f'{utils.SCRIPTS_DIR}/generate_freq_data.py --overwrite '
+        f'--mt {raw_combined_mt_path} '
+        f'--hard-filtered-samples-ht {hard_filter_ht_path} '
+        f'--meta-ht {meta_ht_path} '
+        f'--out-ht {freq_ht_path} '
+        f'--bucket {work_bucket} ',
+        job_name='Var QC: generate frequencies',
+        output_paths=[freq_ht_path],
+        overwrite=overwrite,
+        existence=existence,
+        depends_on=depends_on,
+    )
+
+    rf_anno_job = _add_job(
+        b,
+        cluster,
+        f'{utils.SCRIPTS_DIR}/create_rf_annotations.py --overwrite '
+        f'--info-split-ht {info_split_ht_path} '
+        f'--freq-ht {freq_ht_path} '
+        + (f'--fam-stats-ht {fam_stats_ht_path} ' if fam_stats_ht_path else '')
+        + f'--allele-data-ht {allele_data_ht_path} '
+        f'--qc-ac-ht {qc_ac_ht_path} '
+        f'--bucket {work_bucket} '
+        f'--use-adj-genotypes '
+        f'--out-ht {rf_annotations_ht_path} '
+        + f'--n-partitions {scatter_count * 25}',
+        job_name='Var QC: create RF annotations',
+        output_paths=[rf_annotations_ht_path],
+        overwrite=overwrite,
+        existence=existence,
+        depends_on=[freq_job, var_qc_anno_job, info_job],
+    )
 
     if run_rf:
-        cluster = get_cluster(
+        rf_model_id = f'rf_{str(uuid.uuid4())[:8]}'
+        rf_job = _add_job(
             b,
-            'RF',
-            scatter_count,
-            is_test=is_test,
-            long=True,
+            cluster,
+            f'{utils.SCRIPTS_DIR}/random_forest.py --overwrite '
+            f'--annotations-ht {rf_annotations_ht_path} '
+            f'--bucket {work_bucket} '
+            f'--use-adj-genotypes '
+            f'--out-results-ht {rf_result_ht_path} '
+            f'--out-model-id {rf_model_id} ',
+            job_name='Random forest',
+            output_paths=[rf_result_ht_path],
+            overwrite=overwrite,
+            existence=existence,
             depends_on=[rf_anno_job],
         )
 
-        job_name = 'Random forest'
-        rf_result_ht_path = join(work_bucket, 'rf-result.ht')
-        rf_model_id = f'rf_{str(uuid.uuid4())[:8]}'
-        if overwrite or not utils.file_exists(rf_result_ht_path):
-            rf_job = cluster.add_job(
-                f'{utils.SCRIPTS_DIR}/random_forest.py --overwrite '
-                f'--annotations-ht {rf_annotations_ht_path} '
-                f'--bucket {work_bucket} '
-                f'--use-adj-genotypes '
-                f'--out-results-ht {rf_result_ht_path} '
-                f'--out-model-id {rf_model_id} ',
-                job_name=job_name,
-            )
-            rf_job.depends_on(rf_anno_job)
-        else:
-            rf_job = b.new_job(f'{job_name} [reuse]')
-
         eval_job, final_filter_ht_path = add_rf_eval_jobs(
             b=b,
             dataproc_cluster=cluster,
@@ -183,8 +200,7 @@ def add_variant_qc_jobs(
         )
 
     else:
-        vqsred_vcf_path = join(vqsr_bucket, 'output.vcf.gz')
-        if overwrite or not utils.file_exists(vqsred_vcf_path):
+        if overwrite or not existence[vqsred_vcf_path]:
             vqsr_vcf_job = add_vqsr_jobs(
                 b,
                 combined_mt_path=raw_combined_mt_path,
@@ -204,6 +220,9 @@ def add_variant_qc_jobs(
 
         final_filter_ht_path = join(vqsr_bucket, 'final-filter.ht')
 
+        # AS-VQSR doesn't run on Dataproc and takes long, so the jobs after it
+        # run on a separate cluster that is started only once AS-VQSR is done,
+        # rather than keeping the first cluster idle in the meantime
         cluster = get_cluster(
             b,
             'VQSR eval',
@@ -211,6 +230,7 @@ def add_variant_qc_jobs(
             is_test=is_test,
             long=True,
             depends_on=[rf_anno_job, vqsr_vcf_job],
+            autoscaling_policy=autoscaling_policy,
         )
         eval_job = add_vqsr_eval_jobs(
             b=b,
@@ -231,58 +251,91 @@ def add_variant_qc_jobs(
         )
         eval_job.depends_on(vqsr_vcf_job, rf_anno_job, info_job)
 
-    job_name = 'Making final MT'
-    if not utils.can_reuse(out_filtered_combined_mt_path, overwrite):
-        final_mt_j = cluster.add_job(
-            f'{utils.SCRIPTS_DIR}/make_finalised_mt.py --overwrite '
-            f'--mt {raw_combined_mt_path} '
-            f'--final-filter-ht {final_filter_ht_path} '
-            f'--freq-ht {freq_ht_path} '
-            f'--info-ht {info_split_ht_path} '
-            f'--out-mt {out_filtered_combined_mt_path} '
-            f'--meta-ht {meta_ht_path} ',
-            job_name=job_name,
-        )
-        final_mt_j.depends_on(eval_job)
-    else:
-        final_mt_j = b.new_job(f'{job_name} [reuse]')
+    final_mt_j = _add_job(
+        b,
+        cluster,
+        f'{utils.SCRIPTS_DIR}/make_finalised_mt.py --overwrite '
+        f'--mt {raw_combined_mt_path} '
+        f'--final-filter-ht {final_filter_ht_path} '
+        f'--freq-ht {freq_ht_path} '
+        f'--info-ht {info_split_ht_path} '
+        f'--out-mt {out_filtered_combined_mt_path} '
+        f'--meta-ht {meta_ht_path} ',
+        job_name='Making final MT',
+        output_paths=[out_filtered_combined_mt_path],
+        overwrite=overwrite,
+        existence=existence,
+        depends_on=[eval_job],
+    )
 
-    job_name = f'Making final VCF: prepare HT'
+    final_ht_j = _add_job(
+        b,
+        cluster,
+        f'{utils.SCRIPTS_DIR}/release_vcf_prepare_ht.py '
+        f'--mt {out_filtered_combined_mt_path} '
+        f'--out-ht {export_ht_path} '
+        f'--out-vcf-header-txt {export_vcf_header_txt}',
+        job_name='Making final VCF: prepare HT',
+        output_paths=[export_ht_path, export_vcf_header_txt],
+        overwrite=overwrite,
+        existence=existence,
+        depends_on=[final_mt_j],
+    )
+
+    vcf_paths = {
+        chrom: out_filtered_vcf_ptrn_path.format(CHROM=chrom) for chrom in chroms
+    }
+    chroms_to_export = [
+        chrom
+        for chrom in chroms
+        if not utils.can_reuse(vcf_paths[chrom], overwrite, existence=existence)
+    ]
+    # One job reads the prepared HT once and writes a VCF per chromosome,
+    # instead of a separate job re-reading the HT for each chromosome
+    j = _add_job(
+        b,
+        cluster,
+        f'{utils.SCRIPTS_DIR}/release_vcf_export_chrom.py '
+        f'--ht {export_ht_path} '
+        f'--vcf-header-txt {export_vcf_header_txt} '
+        f"--out-vcf-ptrn '{out_filtered_vcf_ptrn_path}' "
+        f'--name {project_name} '
+        + ''.join(f'--chromosome chr{chrom} ' for chrom in chroms_to_export),
+        job_name='Making final VCF: HT to VCF',
+        output_paths=list(vcf_paths.values()),
+        overwrite=overwrite,
+        existence=existence,
+        depends_on=[final_ht_j],
+    )
+    return [j]
+
+
+def _add_job(
+    b: hb.Batch,
+    dataproc_cluster: dataproc.DataprocCluster,
+    cmd: str,
+    job_name: str,
+    output_paths: List[str],
+    overwrite: bool,
+    existence: Dict[str, bool],
+    depends_on: Optional[List[Job]] = None,
+) -> Job:
+    """
+    Submit `cmd` to the Dataproc cluster, unless all `output_paths` can be reused.
+    In the latter case, adds an empty job so the dependent jobs can still
+    depend on it.
+
+    `existence` is a dict from `utils.prefetch_existence`. It's used to look up
+    `output_paths`, so they should be prefetched.
+    """
     logger.info(job_name)
-    export_ht_path = join(work_bucket, 'export_vcf.ht')
-    export_vcf_header_txt = join(work_bucket, 'export_vcf_header.txt')
-    if not utils.can_reuse([export_ht_path, export_vcf_header_txt], overwrite):
-        final_ht_j = cluster.add_job(
-            f'{utils.SCRIPTS_DIR}/release_vcf_prepare_ht.py '
-            f'--mt {out_filtered_combined_mt_path} '
-            f'--out-ht {export_ht_path} '
-            f'--out-vcf-header-txt {export_vcf_header_txt}',
-            job_name=job_name,
-        )
+    if utils.can_reuse(output_paths, overwrite, existence=existence):
+        j = b.new_job(f'{job_name} [reuse]')
     else:
-        final_ht_j = b.new_job(f'{job_name} [reuse]')
-    final_ht_j.depends_on(final_mt_j)
-
-    jobs = []
-    for chrom in list(map(str, range(1, 22 + 1))) + ['X', 'Y']:
-        job_name = f'Making final VCF: HT to VCF for chr{chrom}'
-        logger.info(job_name)
-        vcf_path = out_filtered_vcf_ptrn_path.format(CHROM=chrom)
-        if not utils.can_reuse([vcf_path], overwrite):
-            j = cluster.add_job(
-                f'{utils.SCRIPTS_DIR}/release_vcf_export_chrom.py '
-                f'--ht {export_ht_path} '
-                f'--vcf-header-txt {export_vcf_header_txt} '
-                f'--out-vcf {vcf_path} '
-                f'--name {project_name} '
-                f'--chromosome chr{chrom}',
-                job_name=job_name,
-            )
-        else:
-            j = b.new_job(f'{job_name} [reuse]')
-        jobs.append(j)
-        j.depends_on(final_ht_j)
-    return jobs
+        j = dataproc_cluster.add_job(cmd, job_name=job_name)
+    if depends_on:
+        j.depends_on(*depends_on)
+    return j
 
 
 def add_rf_eval_jobs(
@@ -304,46 +357,49 @@ def add_rf_eval_jobs(
 
     Returns the final_filter Job object and the path to the final filter HT
     """
-    job_name = 'RF: evaluation'
     score_bin_ht_path = join(work_bucket, 'rf-score-bin.ht')
     score_bin_agg_ht_path = join(work_bucket, 'rf-score-agg-bin.ht')
-    if overwrite or not utils.file_exists(score_bin_ht_path):
-        eval_job = dataproc_cluster.add_job(
-            f'{utils.SCRIPTS_DIR}/evaluation.py --overwrite '
-            f'--mt {combined_mt_path} '
-            f'--rf-annotations-ht {rf_annotations_ht_path} '
-            f'--info-split-ht {info_split_ht_path} '
-            + (f'--fam-stats-ht {fam_stats_ht_path} ' if fam_stats_ht_path else '')
-            + f'--rf-results-ht {rf_result_ht_path} '
-            f'--bucket {work_bucket} '
-            f'--out-bin-ht {score_bin_ht_path} '
-            f'--out-aggregated-bin-ht {score_bin_agg_ht_path} '
-            f'--run-sanity-checks ',
-            job_name=job_name,
-        )
-        if depends_on:
-            eval_job.depends_on(*depends_on)
-    else:
-        eval_job = b.new_job(f'{job_name} [reuse]')
-
-    job_name = 'RF: final filter'
     final_filter_ht_path = join(work_bucket, 'final-filter.ht')
-    if overwrite or not utils.file_exists(final_filter_ht_path):
-        final_filter_job = dataproc_cluster.add_job(
-            f'{utils.SCRIPTS_DIR}/final_filter.py --overwrite '
-            f'--out-final-filter-ht {final_filter_ht_path} '
-            f'--model-id {rf_model_id} '
-            f'--model-name RF '
-            f'--score-name RF '
-            f'--info-split-ht {info_split_ht_path} '
-            f'--freq-ht {freq_ht_path} '
-            f'--score-bin-ht {score_bin_ht_path} '
-            f'--score-bin-agg-ht {score_bin_agg_ht_path} ' + f'--bucket {work_bucket} ',
-            job_name=job_name,
-        )
-        final_filter_job.depends_on(eval_job)
-    else:
-        final_filter_job = b.new_job(f'{job_name} [reuse]')
+    existence = utils.prefetch_existence([score_bin_ht_path, final_filter_ht_path])
+
+    eval_job = _add_job(
+        b,
+        dataproc_cluster,
+        f'{utils.SCRIPTS_DIR}/evaluation.py --overwrite '
+        f'--mt {combined_mt_path} '
+        f'--rf-annotations-ht {rf_annotations_ht_path} '
+        f'--info-split-ht {info_split_ht_path} '
+        + (f'--fam-stats-ht {fam_stats_ht_path} ' if fam_stats_ht_path else '')
+        + f'--rf-results-ht {rf_result_ht_path} '
+        f'--bucket {work_bucket} '
+        f'--out-bin-ht {score_bin_ht_path} '
+        f'--out-aggregated-bin-ht {score_bin_agg_ht_path} '
+        f'--run-sanity-checks ',
+        job_name='RF: evaluation',
+        output_paths=[score_bin_ht_path],
+        overwrite=overwrite,
+        existence=existence,
+        depends_on=depends_on,
+    )
+
+    final_filter_job = _add_job(
+        b,
+        dataproc_cluster,
+        f'{utils.SCRIPTS_DIR}/final_filter.py --overwrite '
+        f'--out-final-filter-ht {final_filter_ht_path} '
+        f'--model-id {rf_model_id} '
+        f'--model-name RF '
+        f'--score-name RF '
+        f'--info-split-ht {info_split_ht_path} '
+        f'--freq-ht {freq_ht_path} '
+        f'--score-bin-ht {score_bin_ht_path} '
+        f'--score-bin-agg-ht {score_bin_agg_ht_path} ' + f'--bucket {work_bucket} ',
+        job_name='RF: final filter',
+        output_paths=[final_filter_ht_path],
+        overwrite=overwrite,
+        existence=existence,
+        depends_on=[eval_job],
+    )
 
     return final_filter_job, final_filter_ht_path
 
@@ -370,69 +426,77 @@ def add_vqsr_eval_jobs(
 
     Returns the final_filter Job object and the path to the final filter HT
     """
-    job_name = 'AS-VQSR: load_vqsr'
     vqsr_filters_split_ht_path = join(work_bucket, 'vqsr-filters-split.ht')
-    if overwrite or not utils.file_exists(vqsr_filters_split_ht_path):
-        load_vqsr_job = dataproc_cluster.add_job(
-            f'{utils.SCRIPTS_DIR}/load_vqsr.py --overwrite '
-            f'--split-multiallelic '
-            f'--out-path {vqsr_filters_split_ht_path} '
-            f'--vqsr-vcf-path {final_gathered_vcf_path} '
-            f'--bucket {work_bucket} ',
-            job_name=job_name,
-        )
-        load_vqsr_job.depends_on(vqsr_vcf_job)
-    else:
-        load_vqsr_job = b.new_job(f'{job_name} [reuse]')
-
-    job_name = 'AS-VQSR: evaluation'
     score_bin_ht_path = join(work_bucket, 'vqsr-score-bin.ht')
     score_bin_agg_ht_path = join(work_bucket, 'vqsr-score-agg-bin.ht')
-    if (
-        overwrite
-        or not utils.file_exists(score_bin_ht_path)
-        or not utils.file_exists(score_bin_agg_ht_path)
-    ):
-        eval_job = dataproc_cluster.add_job(
-            f'{utils.SCRIPTS_DIR}/evaluation.py --overwrite '
-            f'--mt {combined_mt_path} '
-            f'--rf-annotations-ht {rf_annotations_ht_path} '
-            f'--info-split-ht {info_split_ht_path} '
-            + (f'--fam-stats-ht {fam_stats_ht_path} ' if fam_stats_ht_path else '')
-            + (
-                f'--rf-result-ht {rf_result_ht_path} '
-                if (rf_annotations_ht_path and rf_result_ht_path)
-                else ''
-            )
-            + f'--vqsr-filters-split-ht {vqsr_filters_split_ht_path} '
-            f'--bucket {work_bucket} '
-            f'--out-bin-ht {score_bin_ht_path} '
-            f'--out-aggregated-bin-ht {score_bin_agg_ht_path} '
-            f'--run-sanity-checks ',
-            job_name=job_name,
+    existence = utils.prefetch_existence(
+        [
+            vqsr_filters_split_ht_path,
+            score_bin_ht_path,
+            score_bin_agg_ht_path,
+            output_ht_path,
+        ]
+    )
+
+    load_vqsr_job = _add_job(
+        b,
+        dataproc_cluster,
+        f'{utils.SCRIPTS_DIR}/load_vqsr.py --overwrite '
+        f'--split-multiallelic '
+        f'--out-path {vqsr_filters_split_ht_path} '
+        f'--vqsr-vcf-path {final_gathered_vcf_path} '
+        f'--bucket {work_bucket} ',
+        job_name='AS-VQSR: load_vqsr',
+        output_paths=[vqsr_filters_split_ht_path],
+        overwrite=overwrite,
+        existence=existence,
+        depends_on=[vqsr_vcf_job],
+    )
+
+    eval_job = _add_job(
+        b,
+        dataproc_cluster,
+        f'{utils.SCRIPTS_DIR}/evaluation.py --overwrite '
+        f'--mt {combined_mt_path} '
+        f'--rf-annotations-ht {rf_annotations_ht_path} '
+        f'--info-split-ht {info_split_ht_path} '
+        + (f'--fam-stats-ht {fam_stats_ht_path} ' if fam_stats_ht_path else '')
+        + (
+            f'--rf-result-ht {rf_result_ht_path} '
+            if (rf_annotations_ht_path and rf_result_ht_path)
+            else ''
         )
-        eval_job.depends_on(load_vqsr_job, rf_anno_job)
-    else:
-        eval_job = b.new_job(f'{job_name} [reuse]')
+        + f'--vqsr-filters-split-ht {vqsr_filters_split_ht_path} '
+        f'--bucket {work_bucket} '
+        f'--out-bin-ht {score_bin_ht_path} '
+        f'--out-aggregated-bin-ht {score_bin_agg_ht_path} '
+        f'--run-sanity-checks ',
+        job_name='AS-VQSR: evaluation',
+        output_paths=[score_bin_ht_path, score_bin_agg_ht_path],
+        overwrite=overwrite,
+        existence=existence,
+        depends_on=[load_vqsr_job, rf_anno_job],
+    )
 
-    job_name = 'AS-VQSR: final filter'
     vqsr_model_id = 'vqsr_model'
-    if not utils.file_exists(output_ht_path):
-        final_filter_job = dataproc_cluster.add_job(
-            f'{utils.SCRIPTS_DIR}/final_filter.py --overwrite '
-            f'--out-final-filter-ht {output_ht_path} '
-            f'--vqsr-filters-split-ht {vqsr_filters_split_ht_path} '
-            f'--model-id {vqsr_model_id} '
-            f'--model-name VQSR '
-            f'--score-name AS_VQSLOD '
-            f'--info-split-ht {info_split_ht_path} '
-            f'--freq-ht {freq_ht_path} '
-            f'--score-bin-ht {score_bin_ht_path} '
-            f'--score-bin-agg-ht {score_bin_agg_ht_path} '
-            f'--bucket {work_bucket} ',
-            job_name=job_name,
-        )
-        final_filter_job.depends_on(eval_job)
-    else:
-        final_filter_job = b.new_job(f'{job_name} [reuse]')
+    final_filter_job = _add_job(
+        b,
+        dataproc_cluster,
+        f'{utils.SCRIPTS_DIR}/final_filter.py --overwrite '
+        f'--out-final-filter-ht {output_ht_path} '
+        f'--vqsr-filters-split-ht {vqsr_filters_split_ht_path} '
+        f'--model-id {vqsr_model_id} '
+        f'--model-name VQSR '
+        f'--score-name AS_VQSLOD '
+        f'--info-split-ht {info_split_ht_path} '
+        f'--freq-ht {freq_ht_path} '
+        f'--score-bin-ht {score_bin_ht_path} '
+        f'--score-bin-agg-ht {score_bin_agg_ht_path} '
+        f'--bucket {work_bucket} ',
+        job_name='AS-VQSR: final filter',
+        output_paths=[output_ht_path],
+        overwrite=overwrite,
+        existence=existence,
+        depends_on=[eval_job],
+    )
     return final_filter_job
@@ -100,7 +100,7 @@ def filter_low_conf_regions(
     return mt
 
 
-def get_truth_ht() -> hl.Table:
+def get_truth_ht(intervals: Optional[List[hl.Interval]] = None) -> hl.Table:
     """
     Return a table with annotations from the latest version of the corresponding truth data.
 
@@ -110,14 +110,26 @@ def get_truth_ht() -> hl.Table:
         - kgp_phase_1_hc (high confidence sites in 1000 genonmes)
         - mills (Mills & Devine indels)
 
+    :param intervals: optional intervals to read the tables with, e.g. to match
+        the partitioning of a table that the truth data is going to be joined with
     :return: A table with the latest version of popular truth data annotations
     """
-    return (
-        hl.read_table(HAPMAP_HT)
+    ht = (
+        hl.read_table(HAPMAP_HT, _intervals=intervals)
         .select(hapmap=True)
-        .join(hl.read_table(KGP_OMNI_HT).select(omni=True), how='outer')
-        .join(hl.read_table(KGP_HC_HT).select(kgp_phase1_hc=True), how='outer')
-        .join(hl.read_table(MILLS_HT).select(mills=True), how='outer')
-        .repartition(200, shuffle=False)
-        .persist()
+        .join(
+            hl.read_table(KGP_OMNI_HT, _intervals=intervals).select(omni=True),
+            how='outer',
+        )
+        .join(
+            hl.read_table(KGP_HC_HT, _intervals=intervals).select(kgp_phase1_hc=True),
+            how='outer',
+        )
+        .join(
+            hl.read_table(MILLS_HT, _intervals=intervals).select(mills=True),
+            how='outer',
+        )
     )
+    if intervals is None:
+        ht = ht.repartition(200, shuffle=False)
+    return ht.persist()
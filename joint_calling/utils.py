@@ -9,6 +9,7 @@ import logging
 import sys
 import time
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from os.path import isdir, isfile, exists, join, basename
 from typing import Callable, Dict, Optional, Union, Iterable, List
@@ -217,24 +218,56 @@ def file_exists(path: str) -> bool:
     return os.path.exists(path)
 
 
+def prefetch_existence(
+    paths: Iterable[Optional[str]],
+    max_workers: int = 32,
+) -> Dict[str, bool]:
+    """
+    Check the existence of multiple objects at once. Every check is a separate
+    round trip to Google Storage, so they are submitted concurrently from a thread
+    pool instead of one after another.
+    :param paths: paths to check with `file_exists`. Empty values are ignored
+    :param max_workers: maximal number of concurrent checks
+    :return: a dict mapping each path to whether it exists, suitable to pass to
+        `can_reuse(existence=...)`
+    """
+    paths = sorted({p for p in paths if p})
+    if not paths:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as executor:
+        results = list(executor.map(file_exists, paths))
+    return {p: bool(res) for p, res in zip(paths, results)}
+
+
 def can_reuse(
     fpath: Optional[Union[Iterable[str], str]],
     overwrite: bool,
     silent=False,
+    existence: Optional[Dict[str, bool]] = None,
 ) -> bool:
     """
     Checks if `fpath` is good to reuse in the analysis: it exists
     and `overwrite` is False.
 
     If `fpath` is a collection, it requires all files in it to exist.
+
+    If `existence` is provided (see `prefetch_existence`), it's used to look up
+    whether the paths exist instead of checking them one by one.
     """
     if not fpath:
         return False
 
     if not isinstance(fpath, str):
-        return all(can_reuse(fp, overwrite) for fp in fpath)
+        return all(
+            can_reuse(fp, overwrite, silent=silent, existence=existence)
+            for fp in fpath
+        )
 
-    if not file_exists(fpath):
+    if existence is not None and fpath in existence:
+        exists_ = existence[fpath]
+    else:
+        exists_ = file_exists(fpath)
+    if not exists_:
         return False
 
     if overwrite:
@@ -40,7 +40,9 @@ def main(pop: Optional[str]):  # pylint: disable=missing-function-docstring
             somalier_ht.write(sites_ht_path)
         else:
             ht = hl.read_table('gs://cpg-reference/hg38/ancestry/v3/pca_sites_90k.ht/')
-            ht = ht.key_by('locus')
+            # Re-keying only if needed, as key_by can trigger a re-sort
+            if list(ht.key) != ['locus']:
+                ht = ht.key_by('locus')
             ht.write(sites_ht_path)
 
     ht = hl.read_table(sites_ht_path)
@@ -55,6 +57,9 @@ def main(pop: Optional[str]):  # pylint: disable=missing-function-docstring
             & mt.locus.in_autosome()
             & hl.is_defined(ht[mt.locus])
         )
+        # Only GT is used when combining with a dataset for PCA, so the other
+        # entry fields are not written, to make every later read smaller
+        mt = mt.select_entries('GT')
         mt = mt.naive_coalesce(5000)
         mt.write(gnomad_subset_mt_path, overwrite=True)
     mt = hl.read_matrix_table(gnomad_subset_mt_path)
@@ -48,8 +48,18 @@ def main(
 ):  # pylint: disable=missing-function-docstring
     if somalier_samples_fpath.startswith('gs://'):
         local_tmp_dir = tempfile.mkdtemp()
-        cmd = f'gsutil cp {somalier_samples_fpath} {somalier_pairs_fpath}'
-        subprocess.run(cmd, check=False, shell=True)
+        # Downloading both files with one call, and failing if the copy fails
+        # rather than reading stale or missing local files
+        subprocess.run(
+            [
+                'gsutil',
+                'cp',
+                somalier_samples_fpath,
+                somalier_pairs_fpath,
+                local_tmp_dir,
+            ],
+            check=True,
+        )
         local_somalier_pairs_fpath = join(local_tmp_dir, basename(somalier_pairs_fpath))
         local_somalier_samples_fpath = join(
             local_tmp_dir, basename(somalier_samples_fpath)
@@ -4,10 +4,11 @@
 Combine a set of GVCFs into a MatrixTable
 """
 
+import atexit
+import hashlib
+import json
 import os
-from os.path import join, basename
-import subprocess
-from typing import List
+from typing import List, Optional, Tuple
 import logging
 import shutil
 
@@ -81,7 +82,8 @@ TARGET_RECORDS = 25_000
     '--n-partitions',
     'n_partitions',
     type=click.INT,
-    help='Number of partitions for the output matrix table',
+    help='Maximal number of partitions for the output matrix table. '
+    'If the combined matrix table has more partitions, they will be coalesced',
 )
 def main(
     meta_csv_path: str,
@@ -97,12 +99,9 @@ def main(
 
     logger.info(f'Combining GVCFs')
 
-    assert utils.file_exists(meta_csv_path)
-    local_meta_csv_path = join(local_tmp_dir, basename(meta_csv_path))
-    subprocess.run(
-        f'gsutil cp {meta_csv_path} {local_meta_csv_path}', check=False, shell=True
-    )
-    new_samples_df = pd.read_table(local_meta_csv_path)
+    # Only sample names and GVCF paths are used for combining
+    with hl.hadoop_open(meta_csv_path) as f:
+        new_samples_df = pd.read_table(f, usecols=['s', 'gvcf'], dtype=str)
 
     new_mt_path = os.path.join(work_bucket, 'new.mt')
     combine_gvcfs(
@@ -113,28 +112,40 @@ def main(
         overwrite=True,
     )
     new_mt = hl.read_matrix_table(new_mt_path)
+    # The combiner writes exactly one column per input sample, so using the known
+    # number instead of counting columns with a Spark job
+    sample_count = len(new_samples_df)
     logger.info(
-        f'Written {new_mt.cols().count()} new samples to {out_mt_path}, '
+        f'Written {sample_count} new samples to {new_mt_path}, '
         f'n_partitions={new_mt.n_partitions()}'
     )
 
     new_plus_existing_mt = None
     if existing_mt_path:
         logger.info(f'Combining with the existing matrix table {existing_mt_path}')
-        new_plus_existing_mt = _combine_with_the_existing_mt(
+        new_plus_existing_mt, existing_sample_count = _combine_with_the_existing_mt(
             existing_mt_path=existing_mt_path,
             new_mt_path=new_mt_path,
+            new_sample_count=sample_count,
+            work_bucket=work_bucket,
         )
+        sample_count += existing_sample_count
 
     mt = new_plus_existing_mt or new_mt
-    mt.repartition(n_partitions)
+    # Only reducing the number of partitions, which doesn't require a shuffle:
+    # the combiner output is already partitioned along the genome
+    if n_partitions and mt.n_partitions() > n_partitions:
+        mt = mt.naive_coalesce(n_partitions)
     mt.write(out_mt_path, overwrite=True)
+    # Partition count of a written matrix table is read from its metadata
     logger.info(
-        f'Written {mt.count_cols()} samples to {out_mt_path}, '
-        f'n_partitions={mt.n_partitions()}'
+        f'Written {sample_count} samples to {out_mt_path}, '
+        f'n_partitions={hl.read_matrix_table(out_mt_path).n_partitions()}'
     )
 
-    shutil.rmtree(local_tmp_dir)
+    # Removing the local directory with Hail logs on interpreter exit instead of
+    # blocking on it here
+    atexit.register(shutil.rmtree, local_tmp_dir, ignore_errors=True)
 
 
 def _combine_with_the_existing_mt(
@@ -142,25 +153,92 @@ def _combine_with_the_existing_mt(
     # passing as a path because we are going
     # to re-read it with different intervals
     new_mt_path: str,
-) -> hl.MatrixTable:
+    new_sample_count: int,
+    work_bucket: str,
+) -> Tuple[hl.MatrixTable, int]:
+    """
+    Returns the combined matrix table and the number of samples in the existing one
+    """
     # Making sure the tables are keyed by locus only, to make the combiner work.
     existing_mt = hl.read_matrix_table(existing_mt_path).key_rows_by('locus')
-    intervals = vcf_combiner.calculate_new_intervals(
-        existing_mt.rows(),
-        n=TARGET_RECORDS,
-        reference_genome=DEFAULT_REF,
+    existing_samples = sorted(existing_mt.s.collect())
+    existing_sample_count = len(existing_samples)
+
+    # Calculating intervals requires a scan over the existing matrix table rows,
+    # so caching them for next combines with the same existing matrix table.
+    # The existing matrix table can be read-only, so the cache sits in the work
+    # bucket, and it's invalidated if the matrix table changes its shape or its
+    # sample set.
+    intervals_cache_path = os.path.join(
+        work_bucket,
+        f'{os.path.basename(existing_mt_path.rstrip("/"))}-'
+        f'{hashlib.md5(existing_mt_path.encode()).hexdigest()[:8]}-'
+        f'{TARGET_RECORDS}-{DEFAULT_REF}.intervals.json',
     )
+    fingerprint = [
+        existing_sample_count,
+        existing_mt.n_partitions(),
+        hashlib.md5('\n'.join(existing_samples).encode()).hexdigest(),
+    ]
+    intervals = _read_intervals_cache(intervals_cache_path, fingerprint)
+    if intervals is None:
+        intervals = vcf_combiner.calculate_new_intervals(
+            existing_mt.rows(),
+            n=TARGET_RECORDS,
+            reference_genome=DEFAULT_REF,
+        )
+        _write_intervals_cache(intervals_cache_path, fingerprint, intervals)
     new_mt = hl.read_matrix_table(new_mt_path, _intervals=intervals).key_rows_by(
         'locus'
     )
     logger.info(
-        f'Combining {new_mt_path} ({new_mt.count_cols()} samples) '
+        f'Combining {new_mt_path} ({new_sample_count} samples) '
         f'with an existing MatrixTable {existing_mt_path} '
-        f'({existing_mt.count_cols()} samples), '
+        f'({existing_sample_count} samples), '
         f'split into {existing_mt.n_partitions()} partitions)'
     )
     out_mt = vcf_combiner.combine_gvcfs([existing_mt, new_mt])
-    return out_mt
+    return out_mt, existing_sample_count
+
+
+def _read_intervals_cache(path: str, fingerprint: List) -> Optional[List]:
+    """
+    Returns intervals from the cache file if it exists and was written for
+    a matrix table with the same fingerprint. Otherwise, returns None
+    """
+    if not utils.file_exists(path):
+        return None
+    with hl.hadoop_open(path) as f:
+        d = json.load(f)
+    if d['fingerprint'] != fingerprint:
+        logger.info(f'Intervals cache {path} is outdated, recalculating')
+        return None
+    logger.info(f'Reusing intervals from {path}')
+    return hl.dtype(d['type'])._convert_from_json(  # pylint: disable=protected-access
+        d['intervals']
+    )
+
+
+def _write_intervals_cache(path: str, fingerprint: List, intervals: List):
+    """
+    Writes intervals to a JSON file, along with their Hail type and the fingerprint
+    of the matrix table they were calculated for. Nothing is written for an empty
+    list, as the Hail type can't be inferred from it
+    """
+    if not intervals:
+        return
+    t = hl.tarray(hl.expr.impute_type(intervals[0]))
+    with hl.hadoop_open(path, 'w') as f:
+        json.dump(
+            dict(
+                fingerprint=fingerprint,
+                type=str(t),
+                intervals=t._convert_to_json(  # pylint: disable=protected-access
+                    intervals
+                ),
+            ),
+            f,
+        )
 
 
 def combine_gvcfs(
@@ -146,6 +146,13 @@ TRUTH_DATA = ['hapmap', 'omni', 'mills', 'kgp_phase1_hc']
     help='if an intermediate or a final file exists, skip running the code '
     'that generates it.',
 )
+@click.option(
+    '--verbose',
+    'verbose',
+    is_flag=True,
+    help='Log a summary of truth data annotations. Requires an extra pass '
+    'over the written Table',
+)
 def main(  # pylint: disable=too-many-arguments,too-many-locals
     info_split_ht_path: str,
     freq_ht_path: str,
@@ -159,15 +166,31 @@ def main(  # pylint: disable=too-many-arguments,too-many-locals
     n_partitions: int,
     use_adj_genotypes: bool,
     overwrite: bool,  # pylint: disable=unused-argument
+    verbose: bool,
 ):  # pylint: disable=missing-function-docstring
     local_tmp_dir = utils.init_hail('variant_qc_random_forest', local_tmp_dir)
 
     group = 'adj' if use_adj_genotypes else 'raw'
     ht = hl.read_table(info_split_ht_path)
-    ht = ht.transmute(**ht.info)
-    ht = ht.select('lowqual', 'AS_lowqual', 'FS', 'MQ', 'QD', *INFO_FEATURES)
+    # Filtering before joining the annotation tables, so fewer rows are joined,
+    # and keeping only the info fields that are used downstream
+    ht = ht.filter(~ht.AS_lowqual)
+    ht = ht.select(
+        'a_index',
+        'was_split',
+        **{f: ht.info[f] for f in ['FS', 'MQ', 'QD', *INFO_FEATURES]},
+    )
+    preanno_ht_path = join(work_bucket, 'rf-preanno.ht')
+    ht = ht.checkpoint(preanno_ht_path, overwrite=True)
+
+    # Reading the main table and all annotation tables with the same intervals,
+    # so that they are joined partition-wise without shuffling
+    intervals = ht._calculate_new_partitions(  # pylint: disable=protected-access
+        n_partitions
+    )
+    ht = hl.read_table(preanno_ht_path, _intervals=intervals)
 
-    inbreeding_ht = hl.read_table(freq_ht_path)
+    inbreeding_ht = hl.read_table(freq_ht_path, _intervals=intervals)
     inbreeding_ht = inbreeding_ht.select(
         InbreedingCoeff=hl.if_else(
             hl.is_nan(inbreeding_ht.InbreedingCoeff),
@@ -175,28 +198,29 @@ def main(  # pylint: disable=too-many-arguments,too-many-locals
             inbreeding_ht.InbreedingCoeff,
         )
     )
+    fam_stats_ht = None
     if fam_stats_ht_path:
-        fam_stats_ht = hl.read_table(fam_stats_ht_path)
+        fam_stats_ht = hl.read_table(fam_stats_ht_path, _intervals=intervals)
         fam_stats_ht = fam_stats_ht.select(
             f'n_transmitted_{group}', f'ac_children_{group}'
         )
-        ht = ht.annotate(
-            **fam_stats_ht[ht.key],
-        )
 
     logger.info('Annotating Table with all columns from multiple annotation Tables')
-    truth_data_ht = resources.get_truth_ht()
-    allele_data_ht = hl.read_table(allele_data_ht_path)
-    qc_ac_ht = hl.read_table(qc_ac_ht_path)
+    truth_data_ht = resources.get_truth_ht(intervals)
+    allele_data_ht = hl.read_table(allele_data_ht_path, _intervals=intervals)
+    qc_ac_ht = hl.read_table(qc_ac_ht_path, _intervals=intervals)
+    # Keep only variants found in high quality samples
+    qc_ac_ht = qc_ac_ht.filter(qc_ac_ht[f'ac_qc_samples_{group}'] > 0)
+    # All joins are on the same key, annotating in one call so they are
+    # planned together
     ht = ht.annotate(
         **inbreeding_ht[ht.key],
         **truth_data_ht[ht.key],
         **allele_data_ht[ht.key].allele_data,
         **qc_ac_ht[ht.key],
+        **(fam_stats_ht[ht.key] if fam_stats_ht is not None else {}),
     )
-
-    # Filter to only variants found in high quality samples and are not lowqual
-    ht = ht.filter((ht[f'ac_qc_samples_{group}'] > 0) & ~ht.AS_lowqual)
+    ht = ht.filter(hl.is_defined(ht[f'ac_qc_samples_{group}']))
     ht = ht.select(
         'a_index',
         'was_split',
@@ -222,15 +246,16 @@ def main(  # pylint: disable=too-many-arguments,too-many-locals
     if impute_features:
         ht = median_impute_features(ht, {'variant_type': ht.variant_type})
 
-    ht.write(out_ht_path, overwrite=True)
+    ht = ht.checkpoint(out_ht_path, overwrite=True)
 
-    summary = ht.group_by(
-        'omni',
-        'mills',
-        'transmitted_singleton',
-    ).aggregate(n=hl.agg.count())
-    logger.info('Summary of truth data annotations:')
-    summary.show(20)
+    if verbose:
+        summary = ht.group_by(
+            'omni',
+            'mills',
+            'transmitted_singleton',
+        ).aggregate(n=hl.agg.count())
+        logger.info('Summary of truth data annotations:')
+        summary.show(20)
 
 
 if __name__ == '__main__':
@@ -5,7 +5,8 @@ Apply RF-based filters to a matrix table. Must be run after evaluation.py
 """
 
 import logging
-from typing import Optional
+from os.path import join
+from typing import Dict, Optional
 
 import hail as hl
 import click
@@ -97,6 +98,44 @@ FILTER_CENTROMERE_TELOMERE = True
     'final filter Table containing AS_VQSLOD, AS_culprit, NEGATIVE_TRAIN_SITE '
     'and POSITIVE_TRAIN_SITE.',
 )
+@click.option(
+    '--snp-bin-cutoff',
+    'snp_bin_cutoff',
+    type=click.INT,
+    help='RF or VQSR score bin to use as cutoff for SNPs. Value should be between '
+    '1 and 100. Mutually exclusive with --snp-score-cutoff. Defaults to '
+    f'{SNP_BIN_CUTOFF} if neither is provided',
+)
+@click.option(
+    '--snp-score-cutoff',
+    'snp_score_cutoff',
+    type=float,
+    default=SNP_SCORE_CUTOFF,
+    help='RF or VQSR score to use as cutoff for SNPs. Mutually exclusive with '
+    '--snp-bin-cutoff',
+)
+@click.option(
+    '--indel-bin-cutoff',
+    'indel_bin_cutoff',
+    type=click.INT,
+    help='RF or VQSR score bin to use as cutoff for indels. Value should be between '
+    '1 and 100. Mutually exclusive with --indel-score-cutoff. Defaults to '
+    f'{INDEL_BIN_CUTOFF} if neither is provided',
+)
+@click.option(
+    '--indel-score-cutoff',
+    'indel_score_cutoff',
+    type=float,
+    default=INDEL_SCORE_CUTOFF,
+    help='RF or VQSR score to use as cutoff for indels. Mutually exclusive with '
+    '--indel-bin-cutoff',
+)
+@click.option(
+    '--filter-centromere-telomere/--no-filter-centromere-telomere',
+    'filter_centromere_telomere',
+    default=FILTER_CENTROMERE_TELOMERE,
+    help='Filter centromeres and telomeres from the final filter Table',
+)
 @click.option(
     '--inbreeding-coeff-threshold',
     'inbreeding_coeff_threshold',
@@ -115,6 +154,27 @@ FILTER_CENTROMERE_TELOMERE = True
 #     default='vqsr_alleleSpecificTrans',
 #     type=click.Choice(['vqsr_classic', 'vqsr_alleleSpecific', 'vqsr_alleleSpecificTrans']),
 # )
+@click.option(
+    '--n-partitions',
+    'n_partitions',
+    type=click.INT,
+    help='Maximum number of partitions for the output table. The table is '
+    'coalesced if it has more partitions than that',
+)
+@click.option(
+    '--summarize',
+    'summarize',
+    is_flag=True,
+    help='Print a summary of the final filter Table. Requires an extra pass '
+    'over the written Table',
+)
+@click.option(
+    '--skip-score-range-check',
+    'skip_score_range_check',
+    is_flag=True,
+    help='Skip validating the score cutoffs against the range of scores. '
+    'Variants with a missing score still fail the run',
+)
 @click.option(
     '--bucket',
     'work_bucket',
@@ -144,31 +204,61 @@ def main(
     score_bin_agg_ht_path,
     vqsr_filters_split_ht_path,
     inbreeding_coeff_threshold,
-    work_bucket: str,  # pylint: disable=unused-argument
+    snp_bin_cutoff: Optional[int],
+    snp_score_cutoff: Optional[float],
+    indel_bin_cutoff: Optional[int],
+    indel_score_cutoff: Optional[float],
+    filter_centromere_telomere: bool,
+    n_partitions: Optional[int],
+    summarize: bool,
+    skip_score_range_check: bool,
+    work_bucket: str,
     local_tmp_dir: str,
     overwrite,
 ):  # pylint: disable=missing-function-docstring
+    if snp_bin_cutoff is None and snp_score_cutoff is None:
+        snp_bin_cutoff = SNP_BIN_CUTOFF
+    if indel_bin_cutoff is None and indel_score_cutoff is None:
+        indel_bin_cutoff = INDEL_BIN_CUTOFF
+
     local_tmp_dir = utils.init_hail('variant_qc_finalize', local_tmp_dir)
 
     if not overwrite and utils.file_exists(out_final_filter_ht_path):
         ht = hl.read_table(out_final_filter_ht_path)
-        ht.summarize()
     else:
         ht = hl.read_table(score_bin_ht_path)
-        if FILTER_CENTROMERE_TELOMERE:
+        if filter_centromere_telomere:
+            # The table is tiny, so collecting the intervals to let Hail skip
+            # them when reading instead of looking up each variant
             tel_cent_ht = hl.read_table(resources.TEL_AND_CENT_HT)
-            ht = ht.filter(~hl.is_defined(tel_cent_ht[ht.locus]))
+            tel_cent_intervals = tel_cent_ht.aggregate(
+                hl.agg.collect(tel_cent_ht.interval)
+            )
+            ht = hl.filter_intervals(ht, tel_cent_intervals, keep=False)
 
-        info_ht = hl.read_table(info_split_ht_path)
+        info_ht = hl.read_table(info_split_ht_path).select('AS_lowqual')
         ht = ht.filter(~info_ht[ht.key].AS_lowqual)
 
         if model_id.startswith('vqsr_'):
             ht = ht.drop('info')
 
-        freq_ht = hl.read_table(freq_ht_path)
-        ht = ht.annotate(InbreedingCoeff=freq_ht[ht.key].InbreedingCoeff)
+        # Materializing the filtered table, so the following joins only look up
+        # the keys that passed the filters. Always overwriting it, as it depends
+        # on the input tables and options of this run
+        ht = ht.checkpoint(join(work_bucket, 'prefiltered.ht'), overwrite=True)
+
+        # Joining the frequency table once. The temporary fields are dropped
+        # by the transmute in generate_final_filter_ht
+        freq_ht = hl.read_table(freq_ht_path).select('InbreedingCoeff', 'freq')
         freq_idx = freq_ht[ht.key]
-        aggregated_bin_ht = hl.read_table(score_bin_agg_ht_path)
+        ht = ht.annotate(
+            InbreedingCoeff=freq_idx.InbreedingCoeff,
+            freq_ac0=freq_idx.freq[0].AC,
+            freq_ac1=freq_idx.freq[1].AC,
+            freq_af1=freq_idx.freq[1].AF,
+        )
+        # The aggregated bins table is small, so keeping it in memory
+        aggregated_bin_ht = hl.read_table(score_bin_agg_ht_path).cache()
 
         vqsr_ht = None
         if vqsr_filters_split_ht_path:
@@ -178,51 +268,56 @@ def main(
             ht,
             model_name,
             score_name,
-            ac0_filter_expr=freq_idx.freq[0].AC == 0,
-            ts_ac_filter_expr=freq_idx.freq[1].AC == 1,
-            mono_allelic_flag_expr=(freq_idx.freq[1].AF == 1)
-            | (freq_idx.freq[1].AF == 0),
-            snp_bin_cutoff=SNP_BIN_CUTOFF,
-            indel_bin_cutoff=INDEL_BIN_CUTOFF,
-            snp_score_cutoff=SNP_SCORE_CUTOFF,
-            indel_score_cutoff=INDEL_SCORE_CUTOFF,
+            ac0_filter_expr=ht.freq_ac0 == 0,
+            ts_ac_filter_expr=ht.freq_ac1 == 1,
+            mono_allelic_flag_expr=(ht.freq_af1 == 1) | (ht.freq_af1 == 0),
+            snp_bin_cutoff=snp_bin_cutoff,
+            indel_bin_cutoff=indel_bin_cutoff,
+            snp_score_cutoff=snp_score_cutoff,
+            indel_score_cutoff=indel_score_cutoff,
             inbreeding_coeff_cutoff=inbreeding_coeff_threshold,
             aggregated_bin_ht=aggregated_bin_ht,
             bin_id='bin',
             vqsr_ht=vqsr_ht,
-        )
-        ht = ht.annotate_globals(
-            filtering_model=ht.filtering_model.annotate(model_id=model_id)
+            skip_score_range_check=skip_score_range_check,
+            vqsr_checkpoint_path=join(work_bucket, 'pre_vqsr.ht'),
         )
         if model_id.startswith('vqsr_'):
-            ht = ht.annotate_globals(
-                filtering_model=ht.filtering_model.annotate(
-                    snv_training_variables=[
-                        'AS_QD',
-                        'AS_MQRankSum',
-                        'AS_ReadPosRankSum',
-                        'AS_FS',
-                        'AS_SOR',
-                        'AS_MQ',
-                    ],
-                    indel_training_variables=[
-                        'AS_QD',
-                        'AS_MQRankSum',
-                        'AS_ReadPosRankSum',
-                        'AS_FS',
-                        'AS_SOR',
-                    ],
-                )
+            training_variables = dict(
+                snv_training_variables=[
+                    'AS_QD',
+                    'AS_MQRankSum',
+                    'AS_ReadPosRankSum',
+                    'AS_FS',
+                    'AS_SOR',
+                    'AS_MQ',
+                ],
+                indel_training_variables=[
+                    'AS_QD',
+                    'AS_MQRankSum',
+                    'AS_ReadPosRankSum',
+                    'AS_FS',
+                    'AS_SOR',
+                ],
             )
         else:
-            ht = ht.annotate_globals(
-                filtering_model=ht.filtering_model.annotate(
-                    snv_training_variables=ht.features,
-                    indel_training_variables=ht.features,
-                )
+            training_variables = dict(
+                snv_training_variables=ht.features,
+                indel_training_variables=ht.features,
+            )
+        ht = ht.annotate_globals(
+            filtering_model=ht.filtering_model.annotate(
+                model_id=model_id, **training_variables
             )
+        )
 
-        ht = ht.checkpoint(out_final_filter_ht_path, True)
+        # Most of the variants are filtered out upstream, so the inherited
+        # partitions can be small. Merging neighbouring ones avoids a shuffle
+        if n_partitions and ht.n_partitions() > n_partitions:
+            ht = ht.naive_coalesce(n_partitions)
+        ht = ht.checkpoint(out_final_filter_ht_path, True, stage_locally=True)
+
+    if summarize:
         ht.summarize()
 
 
@@ -241,6 +336,8 @@ def generate_final_filter_ht(
     aggregated_bin_ht: Optional[hl.Table] = None,
     bin_id: Optional[str] = None,
     vqsr_ht: hl.Table = None,
+    skip_score_range_check: bool = False,
+    vqsr_checkpoint_path: Optional[str] = None,
 ) -> hl.Table:
     """
     Prepares finalized filtering model given a filtering HT from `rf.apply_rf_model`
@@ -284,6 +381,10 @@ def generate_final_filter_ht(
     :param vqsr_ht: If a VQSR HT is supplied a 'vqsr' annotation containing AS_VQSLOD,
            AS_culprit, NEGATIVE_TRAIN_SITE, and POSITIVE_TRAIN_SITE will be included
            in the returned Table
+    :param skip_score_range_check: skip validating score cutoffs against the range
+           of scores in `ht`. Missing scores are still checked
+    :param vqsr_checkpoint_path: if provided along with `vqsr_ht`, the table is
+           checkpointed to this path before joining with `vqsr_ht`
     :return: Finalized random forest Table annotated with variant filters
     """
     if snp_bin_cutoff is not None and snp_score_cutoff is not None:
@@ -313,43 +414,71 @@ def generate_final_filter_ht(
             'If using snp_bin_cutoff or indel_bin_cutoff, both aggregated_bin_ht and bin_id must be supplied'
         )
 
-    min_score = ht.aggregate(hl.agg.min(ht.score))
-    max_score = ht.aggregate(hl.agg.max(ht.score))
+    # Checking for missing scores, and computing the score range (only needed to
+    # validate score cutoffs) in the same pass over the table
+    stats_exprs = dict(n_missing=hl.agg.count_where(hl.is_missing(ht.score)))
+    if not skip_score_range_check and (
+        snp_score_cutoff is not None or indel_score_cutoff is not None
+    ):
+        stats_exprs['min'] = hl.agg.min(ht.score)
+        stats_exprs['max'] = hl.agg.max(ht.score)
+    score_stats = ht.aggregate(hl.struct(**stats_exprs))
+    if score_stats.n_missing > 0:
+        # Only pulling a few example rows, so the scan stops early
+        missing_rows = ht.filter(hl.is_missing(ht.score)).head(20).collect()
+        logger.error(
+            f'Found {score_stats.n_missing} variants with missing score, e.g.: '
+            f'{missing_rows}'
+        )
+        raise ValueError('Missing Score!')
+    min_score = score_stats.get('min')
+    max_score = score_stats.get('max')
 
-    # Determine SNP and indel score cutoffs if given bin instead of score
+    # Determine SNP and indel score cutoffs if given bin instead of score. Doing it
+    # in one aggregation over aggregated_bin_ht for both SNPs and indels
+    bin_cutoff_exprs = {}
     if snp_bin_cutoff:
         assert aggregated_bin_ht
-        snp_score_cutoff = aggregated_bin_ht.aggregate(
-            hl.agg.filter(
-                aggregated_bin_ht.snv
-                & (aggregated_bin_ht.bin_id == bin_id)
-                & (aggregated_bin_ht.bin == snp_bin_cutoff),
-                hl.agg.min(aggregated_bin_ht.min_score),
-            )
+        bin_cutoff_exprs['snv'] = hl.agg.filter(
+            aggregated_bin_ht.snv
+            & (aggregated_bin_ht.bin_id == bin_id)
+            & (aggregated_bin_ht.bin == snp_bin_cutoff),
+            hl.agg.min(aggregated_bin_ht.min_score),
         )
+    if indel_bin_cutoff:
+        assert aggregated_bin_ht
+        bin_cutoff_exprs['indel'] = hl.agg.filter(
+            ~aggregated_bin_ht.snv
+            & (aggregated_bin_ht.bin_id == bin_id)
+            & (aggregated_bin_ht.bin == indel_bin_cutoff),
+            hl.agg.min(aggregated_bin_ht.min_score),
+        )
+    bin_cutoff_scores = (
+        aggregated_bin_ht.aggregate(hl.struct(**bin_cutoff_exprs))
+        if bin_cutoff_exprs
+        else None
+    )
+
+    if snp_bin_cutoff:
+        snp_score_cutoff = bin_cutoff_scores.snv
         snp_cutoff_global = hl.struct(bin=snp_bin_cutoff, min_score=snp_score_cutoff)
     elif snp_score_cutoff:
-        if snp_score_cutoff < min_score or snp_score_cutoff > max_score:
+        if min_score is not None and not min_score <= snp_score_cutoff <= max_score:
             raise ValueError('snp_score_cutoff is not within the range of score.')
         snp_cutoff_global = hl.struct(min_score=snp_score_cutoff)
     else:
         raise ValueError('Either snp_bin_cutoff or snp_score_cutoff must be set')
 
     if indel_bin_cutoff:
-        assert aggregated_bin_ht
-        indel_score_cutoff = aggregated_bin_ht.aggregate(
-            hl.agg.filter(
-                ~aggregated_bin_ht.snv
-                & (aggregated_bin_ht.bin_id == bin_id)
-                & (aggregated_bin_ht.bin == indel_bin_cutoff),
-                hl.agg.min(aggregated_bin_ht.min_score),
-            )
-        )
+        indel_score_cutoff = bin_cutoff_scores.indel
         indel_cutoff_global = hl.struct(
             bin=indel_bin_cutoff, min_score=indel_score_cutoff
         )
     elif indel_score_cutoff:
-        if indel_score_cutoff < min_score or indel_score_cutoff > max_score:
+        if (
+            min_score is not None
+            and not min_score <= indel_score_cutoff <= max_score
+        ):
             raise ValueError('indel_score_cutoff is not within the range of score.')
         indel_cutoff_global = hl.struct(min_score=indel_score_cutoff)
     else:
@@ -362,10 +491,6 @@ def generate_final_filter_ht(
     # Add filters to HT
     filters = dict()
 
-    if ht.any(hl.is_missing(ht.score)):
-        ht.filter(hl.is_missing(ht.score)).show()
-        raise ValueError('Missing Score!')
-
     filters[model_name] = (
         hl.is_missing(ht.score)
         | (
@@ -383,15 +508,7 @@ def generate_final_filter_ht(
     )
     filters['AC0'] = ac0_filter_expr
 
-    annotations_expr = dict()
-    if model_name == 'RF':
-        # Fix annotations for release
-        annotations_expr.update(
-            {
-                'positive_train_site': hl.or_else(ht.positive_train_site, False),
-                'rf_tp_probability': ht.rf_probability['TP'],
-            }
-        )
+    annotations_expr = _build_rf_annotations(ht) if model_name == 'RF' else dict()
     annotations_expr.update(
         {
             'transmitted_singleton': hl.or_missing(
@@ -399,33 +516,27 @@ def generate_final_filter_ht(
             )
         }
     )
-    if 'feature_imputed' in ht.row:
-        annotations_expr.update(
-            {
-                x: hl.or_missing(~ht.feature_imputed[x], ht[x])
-                for x in ht.row.feature_imputed
-            }
-        )
+    imputed_fields = (
+        list(ht.row.feature_imputed) if 'feature_imputed' in ht.row else []
+    )
+    annotations_expr.update(
+        {x: hl.or_missing(~ht.feature_imputed[x], ht[x]) for x in imputed_fields}
+    )
 
+    # Scanning the row schema once for the bin fields
+    bin_names = [
+        (x, _rename_bin_field(x)) for x in list(ht.row) if x.endswith('bin')
+    ]
+
+    # Deriving the new fields and renaming the bin fields in one transmute.
+    # Globals are not affected by it, so the bin counts are renamed accordingly
     ht = ht.transmute(
         filters=add_filters_expr(filters=filters),
         monoallelic=mono_allelic_flag_expr,
         **{score_name: ht.score},
         **annotations_expr,
+        **{j: ht[i] for i, j in bin_names},
     )
-
-    bin_names = [x for x in ht.row if x.endswith('bin')]
-    bin_names = [
-        (
-            x,
-            x.split('adj_')[0] + x.split('adj_')[1]
-            if len(x.split('adj_')) == 2
-            else 'raw_' + x,
-        )
-        for x in bin_names
-    ]
-    ht = ht.transmute(**{j: ht[i] for i, j in bin_names})
-
     ht = ht.annotate_globals(
         bin_group_variant_counts=hl.struct(
             **{j: ht.bin_group_variant_counts[i] for i, j in bin_names}
@@ -439,15 +550,20 @@ def generate_final_filter_ht(
         inbreeding_coeff_cutoff=inbreeding_coeff_cutoff,
     )
     if vqsr_ht:
-        vqsr = vqsr_ht[ht.key]
+        if vqsr_checkpoint_path:
+            # Materializing the filters and renames, so the join streams
+            # from the checkpoint instead of re-running the upstream joins
+            ht = ht.checkpoint(vqsr_checkpoint_path, overwrite=True)
+        # Only the info struct is needed from the VQSR table
+        vqsr_info = vqsr_ht.select('info')[ht.key].info
         ht = ht.annotate(
             vqsr=hl.struct(
-                AS_VQSLOD=vqsr.info.AS_VQSLOD,
-                AS_culprit=vqsr.info.AS_culprit,
-                NEGATIVE_TRAIN_SITE=vqsr.info.NEGATIVE_TRAIN_SITE,
-                POSITIVE_TRAIN_SITE=vqsr.info.POSITIVE_TRAIN_SITE,
+                AS_VQSLOD=vqsr_info.AS_VQSLOD,
+                AS_culprit=vqsr_info.AS_culprit,
+                NEGATIVE_TRAIN_SITE=vqsr_info.NEGATIVE_TRAIN_SITE,
+                POSITIVE_TRAIN_SITE=vqsr_info.POSITIVE_TRAIN_SITE,
             ),
-            SOR=vqsr.info.SOR,  # NOTE: This was required for v3.1,
+            SOR=vqsr_info.SOR,  # NOTE: This was required for v3.1,
             # we now compute this in `get_site_info_expr`
         )
         ht = ht.drop('AS_culprit')
@@ -455,5 +571,26 @@ def generate_final_filter_ht(
     return ht
 
 
+def _build_rf_annotations(ht: hl.Table) -> Dict[str, hl.expr.Expression]:
+    """
+    Fix RF-specific annotations for release
+    """
+    return {
+        'positive_train_site': hl.or_else(ht.positive_train_site, False),
+        'rf_tp_probability': ht.rf_probability['TP'],
+    }
+
+
+def _rename_bin_field(name: str) -> str:
+    """
+    Remove the "adj_" tag from the bin field name, or add the "raw_" prefix
+    if there is no such tag
+    """
+    i = name.find('adj_')
+    if i >= 0:
+        return name[:i] + name[i + len('adj_') :]
+    return 'raw_' + name
+
+
 if __name__ == '__main__':
     main()  # pylint: disable=E1120
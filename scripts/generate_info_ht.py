@@ -32,6 +32,10 @@ from joint_calling import utils, _version
 logger = logging.getLogger('qc-annotations')
 logger.setLevel(logging.INFO)
 
+# With --approximate-pab, the allele balance binomial test is computed exactly
+# only below this total depth, and with a normal approximation above it
+PAB_APPROX_MIN_DP = 16
+
 
 @click.command()
 @click.version_option(_version.__version__)
@@ -52,6 +56,20 @@ logger.setLevel(logging.INFO)
     callback=utils.get_validation_callback(ext='mt', must_exist=True),
     help='path to the input MatrixTable',
 )
+@click.option(
+    '--n-partitions',
+    'n_partitions',
+    type=click.INT,
+    help='Maximum number of partitions for the info table',
+    default=7500,
+)
+@click.option(
+    '--approximate-pab',
+    'approximate_pab',
+    is_flag=True,
+    help='Use a normal approximation of the allele balance binomial test for '
+    f'AS_pab_max in genotypes with a total LAD of at least {PAB_APPROX_MIN_DP}',
+)
 @click.option(
     '--local-tmp-dir',
     'local_tmp_dir',
@@ -68,6 +86,8 @@ def main(  # pylint: disable=too-many-arguments,too-many-locals,too-many-stateme
     out_info_ht_path: str,
     out_split_info_ht_path: str,
     mt_path: str,
+    n_partitions: int,
+    approximate_pab: bool,
     local_tmp_dir: str,
     overwrite: bool,
 ):
@@ -79,6 +99,8 @@ def main(  # pylint: disable=too-many-arguments,too-many-locals,too-many-stateme
         mt=all_samples_mt,
         out_ht_path=out_info_ht_path,
         out_split_ht_path=out_split_info_ht_path,
+        n_partitions=n_partitions,
+        approximate_pab=approximate_pab,
         overwrite=overwrite,
     )
 
@@ -87,6 +109,8 @@ def compute_info(
     mt: hl.MatrixTable,
     out_ht_path: str,
     out_split_ht_path: str,
+    n_partitions: int = 7500,
+    approximate_pab: bool = False,
     overwrite: bool = False,
 ) -> hl.Table:
     """
@@ -97,6 +121,9 @@ def compute_info(
     :param out_ht_path: where to write the info Table
     :param out_split_ht_path: if provided, in the info Table multiallelics will be split
     and the Table will be written to this file
+    :param n_partitions: maximum number of partitions for the info Table
+    :param approximate_pab: use a normal approximation of the binomial test for
+    AS_pab_max when the total LAD is at least PAB_APPROX_MIN_DP
     :param overwrite: overwrite checkpoints if they exist
     :return: Table with info fields
     """
@@ -107,6 +134,14 @@ def compute_info(
         mt = mt.transmute_entries(**mt.gvcf_info)
         mt = mt.annotate_rows(alt_alleles_range_array=hl.range(1, hl.len(mt.alleles)))
 
+        # The per-genotype values that don't depend on the allele are computed
+        # once per entry. Annotating before building any info expression, so
+        # all expressions below come from the same MatrixTable
+        mt = mt.annotate_entries(
+            is_adj=get_adj_expr(mt.LGT, mt.GQ, mt.DP, mt.LAD),
+            lad_sum=hl.sum(mt.LAD),
+        )
+
         # Compute AS and site level info expr
         # Note that production defaults have changed:
         # For new releases, the `RAW_MQandDP` field replaces the `RAW_MQ` and `MQ_DP` fields
@@ -126,43 +161,49 @@ def compute_info(
         )
 
         # Add AC and AC_raw:
-        # First compute ACs for each non-ref allele, grouped by adj
-        grp_ac_expr = hl.agg.array_agg(
-            lambda ai: hl.agg.filter(
-                mt.LA.contains(ai),
-                hl.agg.group_by(
-                    get_adj_expr(mt.LGT, mt.GQ, mt.DP, mt.LAD),
-                    hl.agg.sum(
-                        mt.LGT.one_hot_alleles(mt.LA.map(hl.str))[mt.LA.index(ai)]
-                    ),
+        # First compute ACs for each allele, grouped by adj. Converting local
+        # genotypes to global ones lets us count all alleles with a single array
+        # sum per entry, instead of a separate filtered sum for each allele
+        grp_ac_expr = hl.agg.filter(
+            hl.is_defined(mt.LGT),
+            hl.agg.group_by(
+                mt.is_adj,
+                hl.agg.array_sum(
+                    hl.experimental.lgt_to_gt(mt.LGT, mt.LA).one_hot_alleles(
+                        mt.alleles
+                    )
                 ),
             ),
-            mt.alt_alleles_range_array,
         )
+        no_ac_expr = hl.range(hl.len(mt.alleles)).map(lambda _: hl.int64(0))
+        ac_adj_expr = grp_ac_expr.get(True, no_ac_expr)
+        ac_non_adj_expr = grp_ac_expr.get(False, no_ac_expr)
+
+        # Annotating raw MT with pab max
+        def _pab_max(ai: hl.expr.Int32Expression) -> hl.expr.Float64Expression:
+            la_idx = mt.LA.index(ai)
+            pval = hl.binom_test(mt.LAD[la_idx], mt.lad_sum, 0.5, 'two-sided')
+            if approximate_pab:
+                pval = hl.if_else(
+                    mt.lad_sum < PAB_APPROX_MIN_DP,
+                    pval,
+                    _binom_test_normal_approx(mt.LAD[la_idx], mt.lad_sum),
+                )
+            return hl.agg.filter(
+                hl.is_defined(la_idx) & mt.LGT.is_het(), hl.agg.max(pval)
+            )
+
+        as_pab_max_expr = hl.agg.array_agg(_pab_max, mt.alt_alleles_range_array)
 
         # Then, for each non-ref allele, compute
         # AC as the adj group
         # AC_raw as the sum of adj and non-adj groups
         info_expr = info_expr.annotate(
-            AC_raw=grp_ac_expr.map(
-                lambda i: hl.int32(i.get(True, 0) + i.get(False, 0))
+            AC_raw=mt.alt_alleles_range_array.map(
+                lambda ai: hl.int32(ac_adj_expr[ai] + ac_non_adj_expr[ai])
             ),
-            AC=grp_ac_expr.map(lambda i: hl.int32(i.get(True, 0))),
-        )
-
-        # Annotating raw MT with pab max
-        info_expr = info_expr.annotate(
-            AS_pab_max=hl.agg.array_agg(
-                lambda ai: hl.agg.filter(
-                    mt.LA.contains(ai) & mt.LGT.is_het(),
-                    hl.agg.max(
-                        hl.binom_test(
-                            mt.LAD[mt.LA.index(ai)], hl.sum(mt.LAD), 0.5, 'two-sided'
-                        )
-                    ),
-                ),
-                mt.alt_alleles_range_array,
-            )
+            AC=mt.alt_alleles_range_array.map(lambda ai: hl.int32(ac_adj_expr[ai])),
+            AS_pab_max=as_pab_max_expr,
         )
 
         info_ht = mt.select_rows(info=info_expr).rows()
@@ -180,8 +221,10 @@ def compute_info(
                 info_ht.alleles, info_ht.info.AS_QUALapprox, indel_phred_het_prior=40
             ),
         )
-        info_ht = info_ht.naive_coalesce(7500)
-        info_ht.write(out_ht_path, overwrite=True)
+        info_ht = info_ht.naive_coalesce(n_partitions)
+        # Checkpointing so the split table below is computed from the written
+        # table rather than from the full matrix table again
+        info_ht = info_ht.checkpoint(out_ht_path, overwrite=True)
 
     if out_split_ht_path and (overwrite or not file_exists(out_split_ht_path)):
         split_info_ht = split_multiallelic_in_info_table(info_ht)
@@ -190,6 +233,18 @@ def compute_info(
     return info_ht
 
 
+def _binom_test_normal_approx(
+    x: hl.expr.Int32Expression, n: hl.expr.Int32Expression
+) -> hl.expr.Float64Expression:
+    """
+    Two-sided p-value of the binomial test with p=0.5, approximated with a normal
+    distribution with continuity correction. Much cheaper than `hl.binom_test`,
+    and close to it when `n` is not too small.
+    """
+    z = (hl.abs(2 * x - n) - 1) / hl.sqrt(hl.float64(n))
+    return hl.min(1.0, 2.0 * hl.pnorm(-z))
+
+
 def split_multiallelic_in_info_table(info_ht: hl.Table) -> hl.Table:
     """
     Generates an info table that splits multi-allelic sites from the multi-allelic
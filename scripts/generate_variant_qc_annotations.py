@@ -21,7 +21,6 @@ from gnomad.utils.sparse_mt import (
     split_lowqual_annotation,
 )
 
-from joint_calling.utils import file_exists
 from joint_calling import utils, _version
 
 logger = logging.getLogger('qc-annotations')
@@ -91,6 +90,13 @@ logger.setLevel(logging.INFO)
     help='Desired base number of partitions for output tables',
     default=5000,
 )
+@click.option(
+    '--fam-stats-n-partitions',
+    'fam_stats_n_partitions',
+    type=click.INT,
+    help='Number of partitions for the family stats table',
+    default=10000,
+)
 def main(  # pylint: disable=too-many-arguments,too-many-locals,too-many-statements,missing-function-docstring
     out_allele_data_ht_path: str,
     out_qc_ac_ht_path: str,
@@ -103,6 +109,7 @@ def main(  # pylint: disable=too-many-arguments,too-many-locals,too-many-stateme
     local_tmp_dir: str,
     overwrite: bool,
     n_partitions: int,
+    fam_stats_n_partitions: int,
 ):
     utils.init_hail('qc_annotations', local_tmp_dir)
 
@@ -113,10 +120,24 @@ def main(  # pylint: disable=too-many-arguments,too-many-locals,too-many-stateme
         add_meta=True,
     )
 
+    run_fam_stats = bool(trios_fam_ped_file and out_fam_stats_ht_path)
+
+    # Checking all outputs at once instead of one round trip per output
+    existence = utils.prefetch_existence(
+        [out_allele_data_ht_path, out_qc_ac_ht_path]
+        + (
+            [out_fam_stats_ht_path]
+            + list(_transmitted_singletons_vcf_paths(work_bucket).values())
+            if run_fam_stats
+            else []
+        )
+    )
+
     generate_allele_data(
         ht=hard_filtered_mt.rows(),
         out_ht_path=out_allele_data_ht_path,
         overwrite=overwrite,
+        existence=existence,
     )
 
     qc_ac_ht = generate_ac(
@@ -124,20 +145,24 @@ def main(  # pylint: disable=too-many-arguments,too-many-locals,too-many-stateme
         out_ht_path=out_qc_ac_ht_path,
         overwrite=overwrite,
         n_partitions=n_partitions * 2,
+        existence=existence,
     )
 
-    if trios_fam_ped_file and out_fam_stats_ht_path:
+    if run_fam_stats:
         fam_stats_ht = generate_fam_stats(
             hard_filtered_mt,
             str(out_fam_stats_ht_path),
             overwrite=overwrite,
             trios_fam_ped_file=trios_fam_ped_file,
+            n_partitions=fam_stats_n_partitions,
+            existence=existence,
         )
         export_transmitted_singletons_vcf(
             fam_stats_ht=fam_stats_ht,
             qc_ac_ht=qc_ac_ht,
             work_bucket=work_bucket,
             overwrite=overwrite,
+            existence=existence,
         )
 
 
@@ -165,6 +190,7 @@ def generate_allele_data(
     ht: hl.Table,
     out_ht_path: str,
     overwrite: bool,
+    existence: Optional[Dict[str, bool]] = None,
 ) -> hl.Table:
     """
     Returns bi-allelic sites HT with the following annotations:
@@ -172,10 +198,11 @@ def generate_allele_data(
     :param Table ht: full unsplit HT
     :param Table out_ht_path: path to writ the resulting table
     :param overwrite: overwrite checkpoints if they exist
+    :param existence: pre-fetched existence of output paths
     :return: Table with allele data annotations
     """
     logger.info('Generate allele data')
-    if not overwrite and file_exists(out_ht_path):
+    if utils.can_reuse(out_ht_path, overwrite, existence=existence):
         return hl.read_table(out_ht_path)
 
     allele_data = hl.struct(
@@ -185,20 +212,17 @@ def generate_allele_data(
 
     ht = hl.split_multi_hts(ht)
     ht = ht.filter(hl.len(ht.alleles) > 1)
-    allele_type = (
-        hl.case()
-        .when(hl.is_snp(ht.alleles[0], ht.alleles[1]), 'snv')
-        .when(hl.is_insertion(ht.alleles[0], ht.alleles[1]), 'ins')
-        .when(hl.is_deletion(ht.alleles[0], ht.alleles[1]), 'del')
-        .default('complex')
+    # Classifying the allele pair once and mapping the type name, rather than
+    # re-classifying it for every is_snp/is_insertion/is_deletion check
+    allele_type = hl.literal({'SNP': 'snv', 'Insertion': 'ins', 'Deletion': 'del'}).get(
+        hl.allele_type(ht.alleles[0], ht.alleles[1]), 'complex'
     )
     ht = ht.annotate(
         allele_data=ht.allele_data.annotate(
             allele_type=allele_type, was_mixed=ht.allele_data.variant_type == 'mixed'
         )
     )
-    ht.write(out_ht_path, overwrite=True)
-    return ht
+    return ht.checkpoint(out_ht_path, overwrite=True)
 
 
 def generate_ac(
@@ -206,6 +230,7 @@ def generate_ac(
     out_ht_path: str,
     overwrite: bool,
     n_partitions: int,
+    existence: Optional[Dict[str, bool]] = None,
 ) -> hl.Table:
     """
     Creates Table containing allele counts per variant.
@@ -213,6 +238,7 @@ def generate_ac(
     :param Table out_ht_path: path to writ the resulting table
     :param overwrite: overwrite checkpoints if they exist
     :param n_partitions: number of partitions for the output
+    :param existence: pre-fetched existence of output paths
     :return: table containing allele counts annotations:
         - `ac_qc_samples_raw`: Allele count of high quality samples
         - `ac_qc_samples_unrelated_raw`: Allele count of high quality
@@ -226,8 +252,7 @@ def generate_ac(
            adj filtering
     """
     logger.info('Generate AC per variant')
-    if not overwrite and file_exists(out_ht_path):
-        logger.info(f'Reusing {out_ht_path}')
+    if utils.can_reuse(out_ht_path, overwrite, existence=existence):
         return hl.read_table(out_ht_path)
 
     mt = hl.experimental.sparse_split_multi(mt, filter_changed_loci=True)
@@ -254,8 +279,7 @@ def generate_ac(
     )
     ht = mt.rows()
     ht = ht.repartition(n_partitions, shuffle=False)
-    ht.write(out_ht_path, overwrite=True)
-    return ht
+    return ht.checkpoint(out_ht_path, overwrite=True)
 
 
 def _make_fam_file(sex_ht: hl.Table, work_bucket: str) -> str:
@@ -275,6 +299,8 @@ def generate_fam_stats(
     out_fam_stats_ht_path: str,
     overwrite: bool,
     trios_fam_ped_file: str,
+    n_partitions: int,
+    existence: Optional[Dict[str, bool]] = None,
 ) -> hl.Table:
     """
     Calculate transmission and de novo mutation statistics using trios in the dataset.
@@ -283,14 +309,14 @@ def generate_fam_stats(
     :param out_fam_stats_ht_path: path to write the resulting Table to
     :param overwrite: overwrite existing intermediate and output files
     :param trios_fam_ped_file: path to text file containing trio pedigree
+    :param n_partitions: number of partitions for the output
+    :param existence: pre-fetched existence of output paths
     :return: Table containing trio stats
     """
     logger.info('Generate FAM stats')
-    if not overwrite and utils.file_exists(out_fam_stats_ht_path):
+    if utils.can_reuse(out_fam_stats_ht_path, overwrite, existence=existence):
         return hl.read_table(out_fam_stats_ht_path)
 
-    mt = hl.experimental.sparse_split_multi(mt, filter_changed_loci=True)
-
     # Load Pedigree data and filter MT to samples present in any of the trios
     ped = hl.Pedigree.read(trios_fam_ped_file, delimiter='\t')
     fam_ht = hl.import_fam(trios_fam_ped_file, delimiter='\t')
@@ -299,11 +325,17 @@ def generate_fam_stats(
     fam_ht = fam_ht.key_by('s').select().distinct()
 
     mt = mt.filter_cols(hl.is_defined(fam_ht[mt.col_key]))
+    # Counting the pedigree members rather than the matrix table columns, so
+    # that logging doesn't need a pass over the dataset
     logger.info(
-        f'Generating family stats using {mt.count_cols()} samples from {len(ped.trios)} trios.'
+        f'Generating family stats using up to {fam_ht.count()} samples '
+        f'from {len(ped.trios)} trios.'
     )
 
+    # Subsetting to trio samples and autosomes before splitting and densifying,
+    # so that only the reduced matrix table is processed
     mt = filter_to_autosomes(mt)
+    mt = hl.experimental.sparse_split_multi(mt, filter_changed_loci=True)
     mt = annotate_adj(mt)
     mt = mt.select_entries('GT', 'GQ', 'AD', 'END', 'adj')
     mt = hl.experimental.densify(mt)
@@ -311,18 +343,15 @@ def generate_fam_stats(
     mt = hl.trio_matrix(mt, pedigree=ped, complete_trios=True)
     trio_adj = mt.proband_entry.adj & mt.father_entry.adj & mt.mother_entry.adj
 
+    # All trio stats are aggregated in the same select_rows, so they are computed
+    # in a single pass over the trio matrix, sharing the same strata
+    strata = {'raw': True, 'adj': trio_adj}
     ht = mt.select_rows(
         **generate_trio_stats_expr(
             mt,
-            transmitted_strata={'raw': True, 'adj': trio_adj},
-            de_novo_strata={
-                'raw': True,
-                'adj': trio_adj,
-            },
-            ac_strata={
-                'raw': True,
-                'adj': trio_adj,
-            },
+            transmitted_strata=strata,
+            de_novo_strata=strata,
+            ac_strata=strata,
             proband_is_female_expr=mt.is_female,
         )
     ).rows()
@@ -330,9 +359,8 @@ def generate_fam_stats(
     ht = ht.filter(
         ht.n_de_novos_raw + ht.n_transmitted_raw + ht.n_untransmitted_raw > 0
     )
-    ht = ht.repartition(10000, shuffle=False)
-    ht.write(out_fam_stats_ht_path, overwrite=True)
-    return ht
+    ht = ht.repartition(n_partitions, shuffle=False)
+    return ht.checkpoint(out_fam_stats_ht_path, overwrite=True)
 
 
 def export_transmitted_singletons_vcf(
@@ -340,29 +368,34 @@ def export_transmitted_singletons_vcf(
     qc_ac_ht: hl.Table,
     work_bucket: str,
     overwrite: bool = False,
+    existence: Optional[Dict[str, bool]] = None,
 ) -> Dict[str, str]:
     """
     Exports the transmitted singleton Table to a VCF.
     :return: None
     """
-    output_vcf_paths = {
-        conf: join(work_bucket, f'transmitted-singletons-{conf}.vcf.bgz')
-        for conf in ['adj', 'raw']
-    }
-    if not overwrite and all(file_exists(path) for path in output_vcf_paths.values()):
+    output_vcf_paths = _transmitted_singletons_vcf_paths(work_bucket)
+    if utils.can_reuse(list(output_vcf_paths.values()), overwrite, existence=existence):
         return output_vcf_paths
 
+    # Joining the family stats once for both confidence levels, and only for
+    # the variants with AC=2
+    ac2_ht = qc_ac_ht.filter(qc_ac_ht.ac_qc_samples_raw == 2)
+    fam_stats = fam_stats_ht[ac2_ht.key]
+    ac2_ht = ac2_ht.annotate(
+        n_transmitted_raw=fam_stats.n_transmitted_raw,
+        n_transmitted_adj=fam_stats.n_transmitted_adj,
+    ).checkpoint(
+        join(work_bucket, 'transmitted-singletons-candidates.ht'),
+        overwrite=True,
+    )
+
     for transmission_confidence in ['raw', 'adj']:
-        ts_ht = qc_ac_ht.filter(
-            (
-                fam_stats_ht[qc_ac_ht.key][f'n_transmitted_{transmission_confidence}']
-                == 1
-            )
-            & (qc_ac_ht.ac_qc_samples_raw == 2)
-        )
-        ts_ht = ts_ht.annotate(s=hl.null(hl.tstr))
-        ts_mt = ts_ht.to_matrix_table_row_major(columns=['s'], entry_field_name='s')
-        ts_mt = ts_mt.filter_cols(False)
+        ts_ht = ac2_ht.filter(
+            ac2_ht[f'n_transmitted_{transmission_confidence}'] == 1
+        ).drop('n_transmitted_raw', 'n_transmitted_adj')
+        # Sites-only matrix table with no columns
+        ts_mt = hl.MatrixTable.from_rows_table(ts_ht)
         hl.export_vcf(
             ts_mt,
             output_vcf_paths[transmission_confidence],
@@ -371,5 +404,12 @@ def export_transmitted_singletons_vcf(
     return output_vcf_paths
 
 
+def _transmitted_singletons_vcf_paths(work_bucket: str) -> Dict[str, str]:
+    return {
+        conf: join(work_bucket, f'transmitted-singletons-{conf}.vcf.bgz')
+        for conf in ['adj', 'raw']
+    }
+
+
 if __name__ == '__main__':
     main()  # pylint: disable=E1120
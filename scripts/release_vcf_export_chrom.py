@@ -1,5 +1,7 @@
+import json
 import logging
 import pickle
+from typing import Optional, Tuple
 
 import click
 import hail as hl
@@ -142,8 +144,16 @@ HGDP_TGP_VCF_INFO_REORDER = [
 @click.option(
     '--out-vcf',
     'out_vcf_path',
-    required=True,
     callback=get_validation_callback(ext='vcf.bgz'),
+    help='path to write the VCF. Either this or --out-vcf-ptrn must be provided',
+)
+@click.option(
+    '--out-vcf-ptrn',
+    'out_vcf_ptrn_path',
+    callback=get_validation_callback(ext='vcf.bgz'),
+    help='path pattern to write a VCF per chromosome, with a {CHROM} placeholder '
+    'to be substituted with a chromosome name without the "chr" prefix. '
+    'Requires one or more --chromosome',
 )
 @click.option(
     '--name',
@@ -153,8 +163,10 @@ HGDP_TGP_VCF_INFO_REORDER = [
 )
 @click.option(
     '--chromosome',
-    'chromosome',
-    help='write a VCF for a chromosome',
+    'chromosomes',
+    multiple=True,
+    help='write a VCF for a chromosome. Can be specified multiple times along '
+    'with --out-vcf-ptrn to export several chromosomes from one read of the Table',
 )
 @click.option(
     '--local-tmp-dir',
@@ -164,31 +176,60 @@ HGDP_TGP_VCF_INFO_REORDER = [
 def main(
     ht_path: str,
     vcf_header_txt_path: str,
-    out_vcf_path: str,
+    out_vcf_path: Optional[str],
+    out_vcf_ptrn_path: Optional[str],
     name: str,
-    chromosome: str,
+    chromosomes: Tuple[str, ...],
     local_tmp_dir: str,
 ):  # pylint: disable=missing-function-docstring
+    if bool(out_vcf_path) == bool(out_vcf_ptrn_path):
+        raise click.BadParameter('Exactly one of --out-vcf or --out-vcf-ptrn expected')
+    if out_vcf_ptrn_path and not chromosomes:
+        raise click.BadParameter('--out-vcf-ptrn requires at least one --chromosome')
+    if out_vcf_path and len(chromosomes) > 1:
+        raise click.BadParameter(
+            'Use --out-vcf-ptrn to export multiple chromosomes, got --out-vcf'
+        )
+
     utils.init_hail(__file__, local_tmp_dir)
 
     ht = hl.read_table(ht_path)
 
     logger.info('Loading VCF header dict...')
     with hl.hadoop_open(vcf_header_txt_path, 'rb') as f:
-        header_dict = pickle.load(f)
-
-    if chromosome:
-        logger.info(f'Exporting chromosome {chromosome}....')
-        ht = hl.filter_intervals(ht, [hl.parse_locus_interval(chromosome)])
+        header_bytes = f.read()
+    # Header dicts are saved as JSON, but older runs saved them as pickles
+    if header_bytes.lstrip().startswith(b'{'):
+        header_dict = json.loads(header_bytes)
+    else:
+        header_dict = pickle.loads(header_bytes)
 
     export_reference = build_vcf_export_reference(name)
 
-    hl.export_vcf(
-        rekey_new_reference(ht, export_reference),
-        out_vcf_path,
-        metadata=header_dict,
-        tabix=True,
-    )
+    if not out_vcf_ptrn_path:
+        if chromosomes:
+            logger.info(f'Exporting chromosome {chromosomes[0]}....')
+            ht = hl.filter_intervals(ht, [hl.parse_locus_interval(chromosomes[0])])
+        hl.export_vcf(
+            rekey_new_reference(ht, export_reference),
+            out_vcf_path,
+            metadata=header_dict,
+            tabix=True,
+        )
+        return
+
+    # The Table is keyed by locus, so filtering intervals only reads the partitions
+    # overlapping each chromosome, and the Table is scanned only once overall
+    for chromosome in chromosomes:
+        vcf_path = out_vcf_ptrn_path.format(CHROM=chromosome.replace('chr', ''))
+        logger.info(f'Exporting chromosome {chromosome} to {vcf_path}....')
+        chrom_ht = hl.filter_intervals(ht, [hl.parse_locus_interval(chromosome)])
+        hl.export_vcf(
+            rekey_new_reference(chrom_ht, export_reference),
+            vcf_path,
+            metadata=header_dict,
+            tabix=True,
+        )
 
 
 if __name__ == '__main__':
@@ -1,6 +1,9 @@
+import collections
+import functools
+import json
 import logging
-import pickle
-from typing import Dict, List, Optional, Set, Union
+from os.path import splitext
+from typing import Dict, List, Optional, Set, Tuple, Union
 
 import click
 import hail as hl
@@ -15,31 +18,24 @@ from gnomad.resources.grch38.gnomad import (
     SUBSETS,
 )
 from gnomad.sample_qc.ancestry import POP_NAMES
-from gnomad.utils.filtering import remove_fields_from_constant
 from gnomad.utils.vcf import (
     add_as_info_dict,
     adjust_vcf_incompatible_types,
-    ALLELE_TYPE_FIELDS,
     AS_FIELDS,
     AS_VQSR_FIELDS,
     create_label_groups,
     ENTRIES,
     FAF_POPS,
     FORMAT_DICT,
-    HISTS,
     INFO_DICT,
     IN_SILICO_ANNOTATIONS_INFO_DICT,
     make_info_dict,
     make_vcf_filter_dict,
-    REGION_FLAG_FIELDS,
     RF_FIELDS,
-    SITE_FIELDS,
-    VQSR_FIELDS,
 )
 from gnomad.variant_qc.pipeline import INBREEDING_COEFF_HARD_CUTOFF
-from gnomad.utils.annotations import region_flag_expr
 
-from joint_calling import utils, _version, resources
+from joint_calling import utils, _version
 from joint_calling.utils import get_validation_callback
 
 
@@ -47,26 +43,24 @@ logger = logging.getLogger(__file__)
 logger.setLevel('INFO')
 
 
-# Add new site fields
-# NEW_SITE_FIELDS = [
-#     'monoallelic',
-#     'transmitted_singleton',
-# ]
-# SITE_FIELDS.extend(NEW_SITE_FIELDS)
+def _remove_fields(fields: List[str], fields_to_remove: List[str]) -> List[str]:
+    """
+    Return a copy of `fields` without `fields_to_remove`. Unlike gnomad's
+    `remove_fields_from_constant`, doesn't modify the gnomad constant in place.
+    """
+    fields_to_remove = set(fields_to_remove)
+    return [f for f in fields if f not in fields_to_remove]
+
 
 # Remove original alleles for containing non-releasable alleles
 MISSING_ALLELE_TYPE_FIELDS = ['original_alleles', 'has_star']
-ALLELE_TYPE_FIELDS = remove_fields_from_constant(
-    ALLELE_TYPE_FIELDS, MISSING_ALLELE_TYPE_FIELDS
-)
 
 # Remove SB (not included in VCF) and SOR (doesn't exist in v3.1) from site fields
 MISSING_SITES_FIELDS = ['SOR', 'SB']
-SITE_FIELDS = remove_fields_from_constant(SITE_FIELDS, MISSING_SITES_FIELDS)
 
 # Remove AS_VarDP from AS fields
 MISSING_AS_FIELDS = ['AS_VarDP']
-AS_FIELDS = remove_fields_from_constant(AS_FIELDS, MISSING_AS_FIELDS)
+AS_FIELDS = _remove_fields(AS_FIELDS, MISSING_AS_FIELDS)
 
 # Make subset list (used in properly filling out VCF header descriptions and naming VCF info fields)
 SUBSET_LIST_FOR_VCF = SUBSETS.copy()
@@ -74,18 +68,15 @@ SUBSET_LIST_FOR_VCF.append('')
 
 # Remove cohorts that have subpop frequencies stored as pop frequencies
 # Inclusion of these subsets significantly increases the size of storage in the VCFs because of the many subpops
-SUBSET_LIST_FOR_VCF = remove_fields_from_constant(
+SUBSET_LIST_FOR_VCF = _remove_fields(
     SUBSET_LIST_FOR_VCF, COHORTS_WITH_POP_STORED_AS_SUBPOP
 )
 
 # Remove decoy from region field flag
 MISSING_REGION_FIELDS = ['decoy']
-REGION_FLAG_FIELDS = remove_fields_from_constant(
-    REGION_FLAG_FIELDS, MISSING_REGION_FIELDS
-)
 
 # All missing fields to remove from vcf info dict
-MISSING_INFO_FIELDS = (
+MISSING_INFO_FIELDS = frozenset(
     MISSING_ALLELE_TYPE_FIELDS
     + MISSING_AS_FIELDS
     + MISSING_REGION_FIELDS
@@ -108,16 +99,16 @@ for pop in HGDP_TGP_KEEP_POPS:
     else:
         HGDP_TGP_POPS[pop] = pop.capitalize()
 
-# Used for HGDP + TGP subset MT VCF output only
-FORMAT_DICT.update(
-    {
-        'RGQ': {
-            'Number': '1',
-            'Type': 'Integer',
-            'Description': 'Unconditional reference genotype confidence, encoded as a phred quality -10*log10 p(genotype call is wrong)',
-        }
-    }
-)
+# Used for HGDP + TGP subset MT VCF output only. Making a copy rather than
+# updating gnomad's dict in place when this module is imported
+FORMAT_DICT = {
+    **FORMAT_DICT,
+    'RGQ': {
+        'Number': '1',
+        'Type': 'Integer',
+        'Description': 'Unconditional reference genotype confidence, encoded as a phred quality -10*log10 p(genotype call is wrong)',
+    },
+}
 
 
 @click.command()
@@ -179,9 +170,18 @@ def main(
     # Setup of parameters and Table/MatrixTable
     parameter_dict = _build_parameter_dict(ht, is_public_subset)
 
-    vcf_ht = _prepare_vcf_ht(ht, is_subset=is_public_subset)
+    vcf_ht = _prepare_vcf_ht(
+        ht,
+        is_subset=is_public_subset,
+        freq_entries_to_remove=parameter_dict['freq_entries_to_remove'],
+    )
     
     if is_public_subset:
+        # Writing the unfurled INFO struct before joining it to the subset MT, so
+        # the join is planned on top of a read rather than the full INFO expression
+        vcf_ht = vcf_ht.checkpoint(
+            splitext(out_ht_path)[0] + '-info.ht', overwrite=True
+        )
         logger.info(
             'Loading subset MT and annotating with the prepared VCF HT for VCF export...'
         )
@@ -192,7 +192,7 @@ def main(
     vcf_ht = _cleanup_ht_for_vcf_export(vcf_ht)
 
     vcf_ht = vcf_ht.checkpoint(out_ht_path, overwrite=True)
-    vcf_ht.describe()
+    logger.debug(f'VCF HT row schema: {vcf_ht.row.dtype}')
 
     _prepare_vcf_header_dict(
         ht=ht,
@@ -221,9 +221,22 @@ def _prepare_vcf_header_dict(
     if not is_public_subset:
         header_dict.pop('format')
 
-    logger.info('Saving header dict to pickle...')
-    with hl.hadoop_open(vcf_header_txt_path, 'wb') as p:
-        pickle.dump(header_dict, p, protocol=pickle.HIGHEST_PROTOCOL)
+    logger.info('Saving header dict to JSON...')
+    # Serializing in memory and uploading with a single write
+    with hl.hadoop_open(vcf_header_txt_path, 'w') as f:
+        f.write(json.dumps(header_dict))
+
+
+@functools.lru_cache(maxsize=None)
+def _create_label_groups(
+    pops: Tuple[str, ...], sexes: Tuple[str, ...]
+) -> List[Dict[str, List[str]]]:
+    """
+    Memoized `create_label_groups`, as the same pops and sexes are used for every
+    subset in `populate_info_dict`. Takes tuples so the arguments are hashable.
+    The returned list is shared between calls and must not be modified.
+    """
+    return create_label_groups(pops=list(pops), sexes=list(sexes))
 
 
 def populate_subset_info_dict(
@@ -248,12 +261,13 @@ def populate_subset_info_dict(
     """
 
     vcf_info_dict = {}
-    faf_label_groups = create_label_groups(pops=faf_pops, sexes=sexes)
+    prefix_before_metric = 'gnomad' in subset
+    faf_label_groups = _create_label_groups(tuple(faf_pops), tuple(sexes))
     for label_group in faf_label_groups:
         vcf_info_dict.update(
             make_info_dict(
                 prefix=subset,
-                prefix_before_metric=True if 'gnomad' in subset else False,
+                prefix_before_metric=prefix_before_metric,
                 pop_names=faf_pops,
                 label_groups=label_group,
                 label_delimiter=label_delimiter,
@@ -262,12 +276,12 @@ def populate_subset_info_dict(
             )
         )
 
-    label_groups = create_label_groups(pops=pops, sexes=sexes)
+    label_groups = _create_label_groups(tuple(pops), tuple(sexes))
     for label_group in label_groups:
         vcf_info_dict.update(
             make_info_dict(
                 prefix=subset,
-                prefix_before_metric=True if 'gnomad' in subset else False,
+                prefix_before_metric=prefix_before_metric,
                 pop_names=pops,
                 label_groups=label_group,
                 label_delimiter=label_delimiter,
@@ -327,16 +341,14 @@ def populate_info_dict(
     :param label_delimiter: String to use as delimiter when making group label combinations.
     :return: Updated INFO dictionary for VCF export.
     """
-    vcf_info_dict = info_dict.copy()
-
-    # Remove MISSING_INFO_FIELDS from info dict
-    for field in MISSING_INFO_FIELDS:
-        vcf_info_dict.pop(field, None)
-
-    # Add allele-specific fields to info dict, including AS_VQSR_FIELDS
-    vcf_info_dict.update(
-        add_as_info_dict(info_dict=info_dict, as_fields=AS_FIELDS + AS_VQSR_FIELDS)
-    )
+    # The INFO dict is assembled from layers that are merged once at the end,
+    # with later layers taking precedence like successive dict updates
+    layers = [
+        # Copy info dict without MISSING_INFO_FIELDS
+        {k: v for k, v in info_dict.items() if k not in MISSING_INFO_FIELDS},
+        # Add allele-specific fields to info dict, including AS_VQSR_FIELDS
+        add_as_info_dict(info_dict=info_dict, as_fields=AS_FIELDS + AS_VQSR_FIELDS),
+    ]
 
     for subset in subset_list:
         if subset == 'gnomad':
@@ -346,7 +358,7 @@ def populate_info_dict(
             description_text = '' if subset == '' else f' in {subset} subset'
             pops = subset_pops
 
-        vcf_info_dict.update(
+        layers.append(
             populate_subset_info_dict(
                 subset=subset,
                 description_text=description_text,
@@ -360,7 +372,7 @@ def populate_info_dict(
     if age_hist_data:
         age_hist_data = '|'.join(str(x) for x in age_hist_data)
 
-    vcf_info_dict.update(
+    layers.append(
         make_info_dict(
             prefix='',
             label_delimiter=label_delimiter,
@@ -371,72 +383,9 @@ def populate_info_dict(
     )
 
     # Add in silico prediction annotations to info_dict
-    vcf_info_dict.update(in_silico_dict)
+    layers.append(in_silico_dict)
 
-    return vcf_info_dict
-
-
-def make_info_expr(
-    t: Union[hl.MatrixTable, hl.Table], hist_prefix: str = '',
-) -> Dict[str, hl.expr.Expression]:
-    """
-    Make Hail expression for variant annotations to be included in VCF INFO field.
-
-    :param t: Table/MatrixTable containing variant annotations to be reformatted for VCF export.
-    :param hist_prefix: Prefix to use for histograms.
-    :return: Dictionary containing Hail expressions for relevant INFO annotations.
-    :rtype: Dict[str, hl.expr.Expression]
-    """
-    vcf_info_dict = {}
-    # Add site-level annotations to vcf_info_dict
-    for field in SITE_FIELDS:
-        vcf_info_dict[field] = t['release_ht_info'][f'{field}']
-
-    # Add AS annotations to info dict
-    for field in AS_FIELDS:
-        vcf_info_dict[field] = t['release_ht_info'][f'{field}']
-    for field in VQSR_FIELDS:
-        vcf_info_dict[field] = t['vqsr'][f'{field}']
-
-    # Add region_flag and allele_info fields to info dict
-    for field in ALLELE_TYPE_FIELDS:
-        vcf_info_dict[field] = t['allele_info'][f'{field}']
-    for field in REGION_FLAG_FIELDS:
-        vcf_info_dict[field] = t['region_flag'][f'{field}']
-
-    # Add underscore to hist_prefix if it isn't empty
-    if hist_prefix != '':
-        hist_prefix += '_'
-
-    # Histograms to export are:
-    # gq_hist_alt, gq_hist_all, dp_hist_alt, dp_hist_all, ab_hist_alt
-    # We previously dropped:
-    # _n_smaller for all hists
-    # _bin_edges for all hists
-    # _n_larger for all hists EXCEPT DP hists
-    for hist in HISTS:
-        hist_type = f'{hist_prefix}qual_hists'
-        hist_dict = {
-            f'{hist}_bin_freq': hl.delimit(t[hist_type][hist].bin_freq, delimiter='|'),
-        }
-        vcf_info_dict.update(hist_dict)
-
-        if 'dp' in hist:
-            vcf_info_dict.update({f'{hist}_n_larger': t[hist_type][hist].n_larger},)
-
-    # Add in silico annotations to info dict
-    vcf_info_dict['cadd_raw_score'] = t['cadd']['raw_score']
-    vcf_info_dict['cadd_phred'] = t['cadd']['phred']
-
-    vcf_info_dict['revel_score'] = t['revel']['revel_score']
-
-    # In the v3.1 release in silico files this was max_ds, but changed to splice_ai_score in releases after v3.1
-    vcf_info_dict['splice_ai_max_ds'] = t['splice_ai']['splice_ai_score']
-    vcf_info_dict['splice_ai_consequence'] = t['splice_ai']['splice_consequence']
-
-    vcf_info_dict['primate_ai_score'] = t['primate_ai']['primate_ai_score']
-
-    return vcf_info_dict
+    return dict(collections.ChainMap(*reversed(layers)))
 
 
 def unfurl_nested_annotations(
@@ -444,7 +393,7 @@ def unfurl_nested_annotations(
     full_release: bool = True,
     subset_release: bool = False,
     full_for_subset: bool = False,
-) -> hl.expr.StructExpression:
+) -> Dict[str, hl.expr.Expression]:
     """
     Create dictionary keyed by the variant annotation labels to be extracted from 
     variant annotation arrays, where the
@@ -482,9 +431,8 @@ def unfurl_nested_annotations(
     popmax, and faf for addition to a subset release. Default is False.
     :param entries_to_remove: Optional Set of frequency entries to remove for 
     vcf_export.
-    :return: StructExpression containing variant annotations and their corresponding 
-    expressions and updated entries and set of frequency entries to remove
-        to remove from the VCF.
+    :return: Dictionary containing variant annotations and their corresponding
+    expressions, to be combined into the INFO StructExpression by the caller.
     """
     expr_dict = {}
 
@@ -504,42 +452,42 @@ def unfurl_nested_annotations(
 
     popmax = f'{prefix}popmax'
     faf = f'{prefix}faf'
-    faf_idx = hl.eval(t.globals[f'{prefix}faf_index_dict'])
-
-    # Unfurl freq index dict
-    # Cycles through each key and index (e.g., k=adj_afr, i=31)
-    logger.info('Unfurling freq data...')
+    faf_index_dict = f'{prefix}faf_index_dict'
 
     # Resetting prefix with '-' as delimiter to match values in freq_idx and faf_idx
     if full_for_subset:
-        prefix = f'full-'
+        prefix = 'full-'
 
     if full_release or full_for_subset:
         logger.info('Adding popmax data...')
-        combo_dict = {
-            f'{prefix}popmax': t[popmax].pop,
-            f'{prefix}AC-popmax': t[popmax].AC,
-            f'{prefix}AN-popmax': t[popmax].AN,
-            f'{prefix}AF-popmax': t[popmax].AF,
-            f'{prefix}nhomalt-popmax': t[popmax].homozygote_count,
-            f'{prefix}faf95-popmax': t[popmax].faf95,
-        }
-        expr_dict.update(combo_dict)
+        popmax_expr = t[popmax]
+        expr_dict.update(
+            {
+                f'{prefix}popmax': popmax_expr.pop,
+                f'{prefix}AC-popmax': popmax_expr.AC,
+                f'{prefix}AN-popmax': popmax_expr.AN,
+                f'{prefix}AF-popmax': popmax_expr.AF,
+                f'{prefix}nhomalt-popmax': popmax_expr.homozygote_count,
+                f'{prefix}faf95-popmax': popmax_expr.faf95,
+            }
+        )
 
         logger.info('Unfurling faf data...')
-        for (
-            k,
-            i,
-        ) in (
-            faf_idx.items()
-        ):  # NOTE: faf annotations are all done on adj-only groupings
-            combo_dict = {
-                f'{prefix}faf95-{k}': t[faf][i].faf95,
-                f'{prefix}faf99-{k}': t[faf][i].faf99,
-            }
-            expr_dict.update(combo_dict)
+        # Evaluating the index dict only when it's needed, as each hl.eval is a
+        # round trip to the backend
+        faf_idx = hl.eval(t.globals[faf_index_dict])
+        faf_expr = t[faf]
+        # The field name prefixes don't depend on the faf group, so they are
+        # formatted once
+        metric_prefixes = [(m, f'{prefix}{m}-') for m in ['faf95', 'faf99']]
+        # NOTE: faf annotations are all done on adj-only groupings
+        expr_dict.update(
+            (metric_prefix + k, faf_expr[i][metric])
+            for k, i in faf_idx.items()
+            for metric, metric_prefix in metric_prefixes
+        )
 
-    return hl.struct(**expr_dict)
+    return expr_dict
 
 
 def filter_to_test(
@@ -556,25 +504,19 @@ def filter_to_test(
         'Filtering to %d partitions on chr20, chrX, and chrY (for tests only)...',
         num_partitions,
     )
-    t_chr20 = hl.filter_intervals(t, [hl.parse_locus_interval('chr20')])
-    t_chr20 = t_chr20._filter_partitions(range(num_partitions))
-
-    t_chrx = hl.filter_intervals(t, [hl.parse_locus_interval('chrX')])
-    t_chrx = t_chrx._filter_partitions(range(num_partitions))
-
-    t_chry = hl.filter_intervals(t, [hl.parse_locus_interval('chrY')])
-    t_chry = t_chry._filter_partitions(range(num_partitions))
-
-    if isinstance(t, hl.MatrixTable):
-        return (
-            t_chr20.union_rows(t_chrx, t_chry)
-            if isinstance(t, hl.MatrixTable)
-            else t_chr20.union(t_chrx, t_chry)
+    # Filtering intervals is lazy and only reads the partitions overlapping
+    # each contig, and the pieces are combined with a single union
+    parts = []
+    for contig in ['chr20', 'chrX', 'chrY']:
+        part = hl.filter_intervals(t, [hl.parse_locus_interval(contig)])
+        parts.append(
+            part._filter_partitions(  # pylint: disable=protected-access
+                range(num_partitions)
+            )
         )
-    else:
-        t = t_chr20.union(t_chrx, t_chry)
-
-    return t
+    if isinstance(t, hl.MatrixTable):
+        return parts[0].union_rows(*parts[1:])
+    return parts[0].union(*parts[1:])
 
 
 def _prepare_vcf_ht(
@@ -597,22 +539,24 @@ def _prepare_vcf_ht(
 
     if not is_subset:
         logger.info('Unfurling full nested frequency annotations and add to INFO field...')
-        info_struct = unfurl_nested_annotations(ht)
+        info_struct = hl.struct(**unfurl_nested_annotations(ht))
     else:
         logger.info('Unfurling nested subset frequency annotations and add to INFO field...')
-        info_struct_subset = unfurl_nested_annotations(
+        info_subset_dict = unfurl_nested_annotations(
             ht,
             full_release=False,
             subset_release=True,
         )
 
         logger.info('Adding full gnomAD callset frequency annotations to INFO field...')
-        info_struct_full_for_subset = unfurl_nested_annotations(
+        info_full_for_subset_dict = unfurl_nested_annotations(
             ht,
             full_release=False,
             full_for_subset=True,
         )
-        info_struct = info_struct_subset.annotate(**info_struct_full_for_subset)
+        # Building a single struct from both dicts rather than annotating
+        # one struct with the other
+        info_struct = hl.struct(**{**info_subset_dict, **info_full_for_subset_dict})
 
     # NOTE: Merging rsid set into a semi-colon delimited string
     # dbsnp might have multiple identifiers for one variant
@@ -625,42 +569,27 @@ def _prepare_vcf_ht(
     # Releases after v3.1 use the set format.
     logger.info('Reformatting rsid...')
     if isinstance(ht.rsid, hl.expr.SetExpression):
-        rsid_expr = hl.str(';').join(ht.rsid)
+        rsid_expr = hl.delimit(ht.rsid, ';')
     else:
         rsid_expr = ht.rsid
 
-    logger.info('Constructing INFO field')
-    ht = ht.annotate(
-        region_flag=region_flag_expr(
-            ht,
-            prob_regions={
-                'lcr': hl.read_table(resources.LCR_INTERVALS_HT), 
-                'segdup': hl.read_table(resources.SEG_DUP_INTERVALS_HT)
-            },
-        ),
-        release_ht_info=ht.info,
-        info=info_struct,
-        rsid=rsid_expr,
-    )
-
-    if freq_entries_to_remove:
-        ht = ht.annotate_globals(
-            freq_entries_to_remove=freq_entries_to_remove
-        )
-    else:
-        ht = ht.annotate_globals(
-            freq_entries_to_remove=hl.empty_set(hl.tstr),
-        )
-
-    # Select relevant fields for VCF export
-    ht = ht.select('info', 'filters', 'rsid')
-
     if vcf_info_reorder:
         logger.info('Rearranging fields to desired order...')
-        ht = ht.annotate(
-            info=ht.info.select(*vcf_info_reorder, *ht.info.drop(*vcf_info_reorder))
+        info_struct = info_struct.select(
+            *vcf_info_reorder, *info_struct.drop(*vcf_info_reorder)
         )
 
+    # Constructing the INFO field and selecting the relevant fields for VCF export
+    # in one go
+    logger.info('Constructing INFO field')
+    ht = ht.select(info=info_struct, filters=ht.filters, rsid=rsid_expr)
+
+    ht = ht.annotate_globals(
+        freq_entries_to_remove=freq_entries_to_remove
+        if freq_entries_to_remove
+        else hl.empty_set(hl.tstr),
+    )
+
     return ht
 
 
@@ -768,11 +697,15 @@ def _build_parameter_dict(
         }
         # Downsampling and subset entries to remove from VCF's freq export
         # Note: Need to extract the non-standard downsamplings from the freq_meta struct to the FREQ_ENTRIES_TO_REMOVE
-        freq_entries_to_remove = {
-            str(x['downsampling'])
-            for x in hl.eval(ht.freq_meta)
-            if 'downsampling' in x
-        }
+        # Filtering in Hail, so only the downsampling values are sent to Python
+        # rather than the whole freq_meta array
+        freq_entries_to_remove = set(
+            hl.eval(
+                ht.freq_meta.filter(lambda x: x.contains('downsampling')).map(
+                    lambda x: x['downsampling']
+                )
+            )
+        )
         freq_entries_to_remove.update(set(COHORTS_WITH_POP_STORED_AS_SUBPOP))
         parameter_dict['freq_entries_to_remove'] = freq_entries_to_remove
         parameter_dict['filtering_model_field'] = 'filtering_model'
@@ -73,6 +73,13 @@ logger.setLevel(logging.INFO)
     '--tmp-bucket',
     'tmp_bucket',
 )
+@click.option(
+    '--n-partitions',
+    'n_partitions',
+    type=click.INT,
+    help='Maximum number of partitions for the --out-mt Matrix Table',
+    default=1000,
+)
 @click.option(
     '--overwrite/--reuse',
     'overwrite',
@@ -100,6 +107,7 @@ def main(  # pylint: disable=too-many-arguments,too-many-locals,missing-function
     out_provided_pop_ht_path: Optional[str],
     out_mt_path: Optional[str],
     tmp_bucket: str,
+    n_partitions: int,
     overwrite: bool,
     is_test: bool,  # pylint: disable=unused-argument
     hail_billing: str,  # pylint: disable=unused-argument
@@ -124,12 +132,19 @@ def main(  # pylint: disable=too-many-arguments,too-many-locals,missing-function
     sites_ht = hl.read_table(resources.ANCESTRY_SITES)
 
     mt = utils.get_mt(mt_path, passing_sites_only=True)
+    # Reference blocks never span contigs, so the autosome filter can be applied
+    # before densifying. The allele and site filters can't: dropping other rows
+    # would drop the reference blocks that densify fills the calls from.
+    mt = mt.filter_rows(mt.locus.in_autosome())
+    # Only GT is kept, and since the rows are filtered to biallelic sites below,
+    # LGT is used as is without converting local alleles. Selecting entries before
+    # densifying, so that the other entry fields aren't carried through the scan.
+    mt = mt.select_entries('END', GT=mt.LGT).select_cols()
     mt = hl.experimental.densify(mt)
-    mt = mt.select_entries(GT=mt.LGT).select_cols()
+    mt = mt.select_entries('GT')
     mt = mt.filter_rows(
         (hl.len(mt.alleles) == 2)
         & hl.is_snp(mt.alleles[0], mt.alleles[1])
-        & mt.locus.in_autosome()
         & hl.is_defined(sites_ht[mt.locus])
     )
     mt = mt.naive_coalesce(5000)
@@ -160,6 +175,7 @@ def main(  # pylint: disable=too-many-arguments,too-many-locals,missing-function
             mt=mt,
             hgdp_union_hq_sites_mt=hgdp_union_mt,
             out_mt_path=out_mt_path,
+            n_partitions=n_partitions,
             overwrite=overwrite,
         )
 
@@ -174,7 +190,6 @@ def _make_provided_pop_ht(
     if utils.can_reuse(out_provided_pop_ht_path, overwrite):
         return hl.read_table(out_provided_pop_ht_path)
     ht = hgdp_union_mt.cols().select_globals().select()
-    logger.info(f'178: {ht.count()}')
     ht = ht.annotate(
         project=hl.case()
         .when(hl.is_defined(hgdp_ht[ht.s]), 'gnomad')
@@ -190,7 +205,6 @@ def _make_provided_pop_ht(
         .when(hl.is_defined(hgdp_ht[ht.s]), hgdp_ht[ht.s].labeled_subpop)
         .default(''),
     )
-    logger.info(f'194: {ht.count()}')
     return ht.checkpoint(out_provided_pop_ht_path, overwrite=overwrite)
 
 
@@ -215,26 +229,19 @@ def get_sites_shared_with_hgdp(
 
     # Entries and columns must be identical, so stripping all column-level data,
     # and all entry-level data except GT.
-    logger.info(f'219 mt cols: {mt.count_cols()}')
     mt = mt.select_entries('GT')
-    logger.info(f'221 mt cols: {mt.count_cols()}')
     hgdp_cols_ht = hgdp_mt.cols()  # saving the column data to re-add later
-    logger.info(f'223 hgdp_cols_ht cols: {hgdp_cols_ht.count()}')
     hgdp_mt = hgdp_mt.select_entries(hgdp_mt.GT).select_cols()
-    logger.info(f'225 hgdp_mt cols: {hgdp_mt.count_cols()}')
 
     # Join samples between two datasets. It will also subset rows to the rows
     # shared between datasets.
     mt = hgdp_mt.union_cols(mt)
-    logger.info(f'230 mt cols: {mt.count_cols()}')
 
     # Add in back the sample-level metadata
     mt = mt.annotate_cols(hgdp_1kg_metadata=hgdp_cols_ht[mt.s])
-    logger.info(f'234 mt cols: {mt.count_cols()}')
 
     if out_mt_path:
-        mt.write(out_mt_path, overwrite=True)
-        mt = hl.read_matrix_table(out_mt_path)
+        mt = mt.checkpoint(out_mt_path, overwrite=True)
 
     return mt
 
@@ -243,23 +250,29 @@ def generate_subset_mt(
     mt: hl.MatrixTable,
     hgdp_union_hq_sites_mt: hl.MatrixTable,
     out_mt_path: Optional[str] = None,
+    n_partitions: int = 1000,
     overwrite: bool = False,
 ) -> hl.MatrixTable:
     """
-    Subset the matrix table `mt` down to sites in `hgdp_union_hq_sites_mt`
+    Subset the matrix table `mt` down to sites in `hgdp_union_hq_sites_mt`,
+    and coalesce it down to at most `n_partitions` partitions
     """
     if utils.can_reuse(out_mt_path, overwrite):
         return hl.read_matrix_table(out_mt_path)
 
     # Filter `mt` down to the loci in `hgdp_union_hq_sites_mt`
     mt = mt.semi_join_rows(hgdp_union_hq_sites_mt.rows())
-    mt = mt.cache()
-    logger.info(f'Number of rows: {mt.count_rows()}')
-    mt = mt.repartition(1000, shuffle=False)
+    # Counting rows requires a full pass over the table, so doing it only when
+    # debugging
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f'Number of rows: {mt.count_rows()}')
+    # Repartitioning without a shuffle can only merge partitions, so it's only
+    # done when there are more partitions than needed
+    if mt.n_partitions() > n_partitions:
+        mt = mt.naive_coalesce(n_partitions)
 
     if out_mt_path:
-        mt.write(out_mt_path, overwrite=True)
-        mt = hl.read_matrix_table(out_mt_path)
+        mt = mt.checkpoint(out_mt_path, overwrite=True)
     return mt
 
 